@@ -11,6 +11,8 @@ from langchain_core.messages import (
     BaseMessage,
 )
 from langgraph.graph import StateGraph, START, END
+from langgraph.config import get_stream_writer
+from langgraph.types import Send
 
 # from langgraph.checkpoint.redis import RedisSaver
 from IPython.display import Image, display
@@ -37,15 +39,39 @@ from mem0 import MemoryClient
 memory = MemoryClient()
 
 
+def merge_agent_outputs(left: Dict[str, str], right: Dict[str, str]) -> Dict[str, str]:
+    """Merge outputs written by concurrent agents; an empty dict resets for a new turn."""
+    if not right:
+        return {}
+    merged = dict(left or {})
+    merged.update(right)
+    return merged
+
+
+def merge_unique(left: List[Any], right: List[Any]) -> List[Any]:
+    """Order preserving union of two lists; an empty list resets for a new turn."""
+    if not right:
+        return []
+    merged = list(left or [])
+    merged.extend(item for item in right if item not in merged)
+    return merged
+
+
 class GraphState(TypedDict, total=False):
     input: str
     uploaded_doc: str
+    # every document uploaded in the session, {"doc_id", "name", "path"} each
+    uploaded_docs: Annotated[List[Dict[str, str]], merge_unique]
     uploaded_img: str
+    # images of the latest request that carried any, {"doc_id", "name", "path"} each
+    uploaded_imgs: List[Dict[str, str]]
     agent_order: List[Dict[str, str]]
     routing_reasoning: str
     current_agent_index: int
-    processed_agents: List[str]
-    agent_outputs: Dict[str, str]
+    dag_index: int
+    completed_agents: Annotated[List[int], merge_unique]
+    processed_agents: Annotated[List[str], merge_unique]
+    agent_outputs: Annotated[Dict[str, str], merge_agent_outputs]
     messages_added: bool
     final_response: str
     user_id: str
@@ -54,6 +80,18 @@ class GraphState(TypedDict, total=False):
     past_memory: str
 
 
+AGENT_NODES = ["Document_qna", "General_qna", "News", "Image_qna", "Refiner"]
+
+# agent name used by the Router -> key of its result in agent_outputs
+OUTPUT_KEYS = {
+    "Document_qna": "Doc_QnA",
+    "News": "News",
+    "General_qna": "General_QnA",
+    "Image_qna": "Image_qna",
+    "Refiner": "ContentRefiner",
+}
+
+
 llm = ChatGoogleGenerativeAI(
     model="gemini-2.0-flash", temperature=0, google_api_key=os.getenv("GOOGLE_API_KEY")
 )
@@ -68,7 +106,7 @@ def format_history(history: List[BaseMessage]) -> str:
     return formatted.strip()
 
 
-def Router(state: GraphState) -> GraphState:
+async def Router(state: GraphState) -> GraphState:
     try:
         query = state["input"]
         previous_memory = state.get("past_memory", "")
@@ -84,7 +122,7 @@ def Router(state: GraphState) -> GraphState:
         ]
         # print("query structured")
 
-        response = llm.invoke(messages)
+        response = await llm.ainvoke(messages)
         raw = response.content.strip()
         if raw.startswith("```"):
             raw = re.sub(r"^```[a-z]*\n?", "", raw)
@@ -112,6 +150,7 @@ def Router(state: GraphState) -> GraphState:
         state["routing_reasoning"] = reasoning
         state["agent_outputs"] = {}
         state["processed_agents"] = []
+        state["completed_agents"] = []
         state["current_agent_index"] = 0
         # print(state)
     except Exception as e:
@@ -123,6 +162,7 @@ def Router(state: GraphState) -> GraphState:
         )
         state["agent_outputs"] = {}
         state["processed_agents"] = []
+        state["completed_agents"] = []
         state["current_agent_index"] = 0
         print(f"Error in Routing : {e}")
 
@@ -132,7 +172,7 @@ def Router(state: GraphState) -> GraphState:
 def route_to_agents(state: GraphState) -> GraphState:
     agent_order = state.get(
         "agent_order",
-        [{"name": "Aggregator", "query": f"{state["input"]}", "dependencies": []}],
+        [{"name": "Aggregator", "query": state["input"], "dependencies": []}],
     )
 
     if "current_agent_index" not in state:
@@ -147,111 +187,171 @@ def route_to_agents(state: GraphState) -> GraphState:
     return "Aggregator"
 
 
-def Document_qna(state: GraphState) -> GraphState:
-    try:
-        query = state["agent_order"][state["current_agent_index"]]["query"]
-        dependencies_list = state["agent_order"][state["current_agent_index"]][
-            "dependencies"
+def dispatch_ready_agents(state: GraphState) -> Any:
+    """DAG scheduler: fan out every agent whose dependencies are satisfied.
+
+    Agents are identified by their index in ``agent_order``. Each ready agent
+    is sent its own copy of the state with ``dag_index`` set, so the same tool
+    can run more than once per turn with different queries; repeated runs keep
+    their outputs apart (see agent_output_key).
+    """
+    agent_order = state.get("agent_order") or []
+    completed = set(state.get("completed_agents") or [])
+
+    pending = [
+        index
+        for index, agent in enumerate(agent_order)
+        if index not in completed and agent.get("name") in AGENT_NODES
+    ]
+    if not pending:
+        return "Aggregator"
+
+    scheduled_names = {agent_order[index]["name"] for index in pending}
+    ready = [
+        index
+        for index in pending
+        if not any(
+            dep in scheduled_names for dep in agent_order[index].get("dependencies", [])
+        )
+    ]
+
+    if not ready:
+        # Cyclic dependencies from the Router, run what is left rather than stall
+        print(f"No agent has its dependencies satisfied, running {pending} anyway")
+        ready = pending
+
+    print(f"Dispatching : {[agent_order[index]['name'] for index in ready]}")
+    return [
+        Send(agent_order[index]["name"], {**state, "dag_index": index})
+        for index in ready
+    ]
+
+
+async def Scheduler(state: GraphState) -> GraphState:
+    """Join point of the DAG mode, every dispatched agent finishes before this runs."""
+    return {}
+
+
+def current_agent(state: GraphState) -> Dict[str, Any]:
+    index = state.get("dag_index", state.get("current_agent_index", 0))
+    return state["agent_order"][index]
+
+
+def agent_output_key(state: GraphState, output_key: str) -> str:
+    """Key of the current agent's result, "News #2" for the second News run of a turn"""
+    agent_order = state.get("agent_order") or []
+    index = state.get("dag_index", state.get("current_agent_index", 0))
+    if index >= len(agent_order):
+        return output_key
+    name = agent_order[index].get("name")
+    earlier = sum(1 for agent in agent_order[:index] if agent.get("name") == name)
+    return f"{output_key} #{earlier + 1}" if earlier else output_key
+
+
+def build_dependency_context(state: GraphState, agent: Dict[str, Any]) -> str:
+    dependencies_context = ""
+    for dep in agent.get("dependencies", []):
+        output_key = dep if dep in state["agent_outputs"] else OUTPUT_KEYS.get(dep)
+        # every run of the tool this turn, see agent_output_key
+        outputs = [
+            (key, value)
+            for key, value in state["agent_outputs"].items()
+            if output_key and (key == output_key or key.startswith(f"{output_key} #"))
         ]
+        if not outputs:
+            print(f"Dependency {dep} output not found in agent_outputs")
+        for key, dep_output in outputs:
+            dependencies_context += f"Dependency : {key} ouput: {dep_output}"
+    return dependencies_context
+
+
+def finish_agent(
+    state: GraphState, output_key: str, processed_name: str, result: Any = None
+) -> GraphState:
+    """Record an agent's result.
+
+    In sequential mode the state is updated in place and the index advanced.
+    In DAG mode only the agent's own writes are returned, and the reducers on
+    ``GraphState`` merge them with the other branches of the same step.
+    """
+    output_key = agent_output_key(state, output_key)
+    if "dag_index" in state:
+        update = {
+            "processed_agents": [processed_name],
+            "completed_agents": [state["dag_index"]],
+        }
+        if result is not None:
+            update["agent_outputs"] = {output_key: result}
+        return update
+
+    if result is not None:
+        state["agent_outputs"][output_key] = result
+    state["processed_agents"].append(processed_name)
+    if state["current_agent_index"] + 1 <= len(state["agent_order"]):
+        state["current_agent_index"] = state["current_agent_index"] + 1
+    else:
+        state["current_agent_index"] = 0
+    return state
+
 
-        dependencies_context = ""
-        if dependencies_list:
-            for dep in dependencies_list:
-                if dep in state["agent_outputs"]:
-                    dep_output = state["agent_outputs"][dep]
-                    dependencies_context += f"Dependency : {dep} ouput: {dep_output}"
-                else:
-                    print(f"Dependency {dep} output not found in agent_outputs")
+async def Document_qna(state: GraphState) -> GraphState:
+    try:
+        agent = current_agent(state)
+        query = agent["query"]
+        dependencies_context = build_dependency_context(state, agent)
 
         history = state["messages"][:-10]
         # print(query)
-        uploaded_doc_path = state["uploaded_doc"]
+        uploaded_doc_path = state.get("uploaded_doc", "")
         # print(uploaded_doc_path)
-        result = rag_qa_tool.invoke(
+        result = await rag_qa_tool.ainvoke(
             {
                 "file_path": uploaded_doc_path,
                 "query": query,
                 "dependency_context": dependencies_context,
                 "message_history": history,
+                "documents": state.get("uploaded_docs", []),
+                "mode": agent.get("mode", ""),
             }
         )
         # print(result)
-        state["agent_outputs"]["Doc_QnA"] = result
-        state["processed_agents"].append("Document_QnA")
-        if state["current_agent_index"] + 1 <= len(state["agent_order"]):
-            state["current_agent_index"] = state["current_agent_index"] + 1
-        else:
-            state["current_agent_index"] = 0
+        return finish_agent(state, "Doc_QnA", "Document_QnA", result)
 
     except Exception as e:
-        state["processed_agents"].append("Document_QnA")
-        if state["current_agent_index"] + 1 <= len(state["agent_order"]):
-            state["current_agent_index"] = state["current_agent_index"] + 1
-        else:
-            state["current_agent_index"] = 0
         print(f"Error in Doc_QnA : {e}")
-    return state
+        return finish_agent(state, "Doc_QnA", "Document_QnA")
 
 
-def News(state: GraphState) -> GraphState:
+async def News(state: GraphState) -> GraphState:
     try:
-        query = state["agent_order"][state["current_agent_index"]]["query"]
+        agent = current_agent(state)
+        query = agent["query"]
         print(query)
-        dependencies_list = state["agent_order"][state["current_agent_index"]][
-            "dependencies"
-        ]
-
-        dependencies_context = ""
-        if dependencies_list:
-            for dep in dependencies_list:
-                if dep in state["agent_outputs"]:
-                    dep_output = state["agent_outputs"][dep]
-                    dependencies_context += f"Dependency : {dep} ouput: {dep_output}"
-                else:
-                    print(f"Dependency {dep} output not found in agent_outputs")
+        dependencies_context = build_dependency_context(state, agent)
         history = state["messages"][:-10]
 
         print("entering news tool")
-        result = financial_news_search.invoke(
+        result = await financial_news_search.ainvoke(
             {
                 "query": query,
                 "dependency_context": dependencies_context,
                 "message_history": history,
             }
         )
-        state["agent_outputs"]["News"] = result
-        state["processed_agents"].append("NEWS")
-        if state["current_agent_index"] + 1 <= len(state["agent_order"]):
-            state["current_agent_index"] = state["current_agent_index"] + 1
-        else:
-            state["current_agent_index"] = 0
+        return finish_agent(state, "News", "NEWS", result)
     except Exception as e:
-        state["processed_agents"].append("NEWS")
-        if state["current_agent_index"] + 1 <= len(state["agent_order"]):
-            state["current_agent_index"] = state["current_agent_index"] + 1
-        else:
-            state["current_agent_index"] = 0
         print(f"Error in News : {e}")
-    return state
+        return finish_agent(state, "News", "NEWS")
 
 
-def General_qna(state: GraphState) -> GraphState:
+async def General_qna(state: GraphState) -> GraphState:
     try:
-        query = state["agent_order"][state["current_agent_index"]]["query"]
-        dependencies_list = state["agent_order"][state["current_agent_index"]][
-            "dependencies"
-        ]
-        dependencies_context = ""
-        if dependencies_list:
-            for dep in dependencies_list:
-                if dep in state["agent_outputs"]:
-                    dep_output = state["agent_outputs"][dep]
-                    dependencies_context += f"Dependency : {dep} ouput: {dep_output}"
-                else:
-                    print(f"Dependency {dep} output not found in agent_outputs")
+        agent = current_agent(state)
+        query = agent["query"]
+        dependencies_context = build_dependency_context(state, agent)
         history = state["messages"][:-10]
 
-        result = gen_qna.invoke(
+        result = await gen_qna.ainvoke(
             {
                 "question": query,
                 "dependency_context": dependencies_context,
@@ -259,121 +359,78 @@ def General_qna(state: GraphState) -> GraphState:
             }
         )
 
-        state["agent_outputs"]["General_QnA"] = result
-        state["processed_agents"].append("General_QnA")
-        if state["current_agent_index"] + 1 <= len(state["agent_order"]):
-            state["current_agent_index"] = state["current_agent_index"] + 1
-        else:
-            state["current_agent_index"] = 0
+        return finish_agent(state, "General_QnA", "General_QnA", result)
     except Exception as e:
-        state["processed_agents"].append("General_QnA")
-        if state["current_agent_index"] + 1 <= len(state["agent_order"]):
-            state["current_agent_index"] = state["current_agent_index"] + 1
-        else:
-            state["current_agent_index"] = 0
         print(f"Error in General_qna : {e}")
-    return state
+        return finish_agent(state, "General_QnA", "General_QnA")
 
 
-def Image_qna(state: GraphState) -> GraphState:
+async def Image_qna(state: GraphState) -> GraphState:
     try:
-        query = state["agent_order"][state["current_agent_index"]]["query"]
-        dependencies_list = state["agent_order"][state["current_agent_index"]][
-            "dependencies"
-        ]
-
-        dependencies_context = ""
-        if dependencies_list:
-            for dep in dependencies_list:
-                if dep in state["agent_outputs"]:
-                    dep_output = state["agent_outputs"][dep]
-                    dependencies_context += f"Dependency : {dep} ouput: {dep_output}"
-                else:
-                    print(f"Dependency {dep} output not found in agent_outputs")
+        agent = current_agent(state)
+        query = agent["query"]
+        dependencies_context = build_dependency_context(state, agent)
         history = state["messages"][:-10]
 
         # print(query)
-        uploaded_img = state["uploaded_img"]
+        uploaded_img = state.get("uploaded_img", "")
         # print(uploaded_doc_path)
-        response = image_qna.invoke(
+        response = await image_qna.ainvoke(
             {
                 "uploaded_file": uploaded_img,
                 "query": query,
                 "dependency_context": dependencies_context,
                 "message_history": history,
+                "images": state.get("uploaded_imgs", []),
             }
         )
-        state["agent_outputs"]["Image_qna"] = response
-        state["processed_agents"].append("Image_qna")
-        if state["current_agent_index"] + 1 <= len(state["agent_order"]):
-            state["current_agent_index"] = state["current_agent_index"] + 1
-        else:
-            state["current_agent_index"] = 0
+        return finish_agent(state, "Image_qna", "Image_qna", response)
     except Exception as e:
-        state["processed_agents"].append("Image_qna")
-        if state["current_agent_index"] + 1 <= len(state["agent_order"]):
-            state["current_agent_index"] = state["current_agent_index"] + 1
-        else:
-            state["current_agent_index"] = 0
         print(f"Error in Image_qna : {e}")
-    return state
+        return finish_agent(state, "Image_qna", "Image_qna")
 
 
-def Refiner(state: GraphState) -> GraphState:
+async def Refiner(state: GraphState) -> GraphState:
     try:
-        query = state["agent_order"][state["current_agent_index"]]["query"]
-        dependencies_list = state["agent_order"][state["current_agent_index"]][
-            "dependencies"
-        ]
-
-        dependencies_context = ""
-        if dependencies_list:
-            for dep in dependencies_list:
-                if dep in state["agent_outputs"]:
-                    dep_output = state["agent_outputs"][dep]
-                    dependencies_context += f"Dependency : {dep} ouput: {dep_output}"
-                else:
-                    print(f"Dependency {dep} output not found in agent_outputs")
+        agent = current_agent(state)
+        query = agent["query"]
+        dependencies_context = build_dependency_context(state, agent)
         history = state["messages"][:-10]
 
-        result = ContentRefiner.invoke(
+        result = await ContentRefiner.ainvoke(
             {
                 "query": query,
                 "dependency_context": dependencies_context,
                 "message_history": history,
             }
         )
-        state["agent_outputs"]["ContentRefiner"] = result
-        state["processed_agents"].append("ContentRefiner")
-        if state["current_agent_index"] + 1 <= len(state["agent_order"]):
-            state["current_agent_index"] = state["current_agent_index"] + 1
-        else:
-            state["current_agent_index"] = 0
+        return finish_agent(state, "ContentRefiner", "ContentRefiner", result)
     except Exception as e:
-        state["processed_agents"].append("ContentRefiner")
-        if state["current_agent_index"] + 1 <= len(state["agent_order"]):
-            state["current_agent_index"] = state["current_agent_index"] + 1
-        else:
-            state["current_agent_index"] = 0
         print(f"Error in ContentRefiner : {e}")
-    return state
+        return finish_agent(state, "ContentRefiner", "ContentRefiner")
 
 
-def Aggregator(state: GraphState) -> GraphState:
+async def Aggregator(state: GraphState) -> GraphState:
     try:
         final_agent_outputs = state["agent_outputs"]
         routing_reasoning = state.get("routing_reasoning", "")
         initial_query = state["input"]
         previous_memory = state.get("past_memory", "")
         history = format_history(state["messages"][-10:])
+        # streams answer tokens to the /stream endpoints, no-op for plain invocations
+        writer = get_stream_writer()
 
         if not final_agent_outputs:
             state["final_response"] = "No agent outputs to aggregate."
+            writer({"token": state["final_response"]})
             return state
 
         if len(final_agent_outputs) == 1:
+            # the tool's answer is already complete, so single-agent answers reach
+            # the stream as one token event rather than token by token
             _, response = next(iter(final_agent_outputs.items()))
             state["final_response"] = response
+            writer({"token": response})
 
         else:
             aggregation_prompt = f"""
@@ -399,8 +456,11 @@ def Aggregator(state: GraphState) -> GraphState:
                 HumanMessage(content=aggregation_prompt),
             ]
 
-            response = llm(messages)
-            state["final_response"] = response.content
+            final_response = ""
+            async for chunk in llm.astream(messages):
+                final_response += chunk.content
+                writer({"token": chunk.content})
+            state["final_response"] = final_response
 
     except Exception as e:
         print(f"Error in Aggregation : {e}")
@@ -408,7 +468,16 @@ def Aggregator(state: GraphState) -> GraphState:
     return state
 
 
-def BuildGraph(Checkpointer: Any) -> Any:
+def BuildGraph(Checkpointer: Any, scheduler: str = "sequential") -> Any:
+    """Compile the agent graph.
+
+    scheduler="sequential" walks agent_order one agent at a time.
+    scheduler="dag" runs every agent whose dependencies are done in parallel
+    and joins in the Scheduler node before dependents and the Aggregator.
+    """
+    if scheduler not in ("sequential", "dag"):
+        raise ValueError(f"Unknown scheduler mode: {scheduler}")
+
     builder = StateGraph(GraphState)
 
     # builder.add_node("load_memory", load_memory)
@@ -430,35 +499,37 @@ def BuildGraph(Checkpointer: Any) -> Any:
 
     builder.set_entry_point("Router")
 
-    tool_names = [
-        "Document_qna",
-        "General_qna",
-        "News",
-        "Image_qna",
-        "Refiner",
-        "Aggregator",
-    ]
+    if scheduler == "dag":
+        builder.add_node("Scheduler", Scheduler)
 
-    routing_map = {
-        "Document_qna": "Document_qna",
-        "General_qna": "General_qna",
-        "News": "News",
-        "Image_qna": "Image_qna",
-        "Refiner": "Refiner",
-        "Aggregator": "Aggregator",
-    }
+        dispatch_targets = AGENT_NODES + ["Aggregator"]
+        builder.add_conditional_edges("Router", dispatch_ready_agents, dispatch_targets)
+        for agent_node in AGENT_NODES:
+            builder.add_edge(agent_node, "Scheduler")
+        builder.add_conditional_edges(
+            "Scheduler", dispatch_ready_agents, dispatch_targets
+        )
+    else:
+        routing_map = {
+            "Document_qna": "Document_qna",
+            "General_qna": "General_qna",
+            "News": "News",
+            "Image_qna": "Image_qna",
+            "Refiner": "Refiner",
+            "Aggregator": "Aggregator",
+        }
 
-    builder.add_conditional_edges("Router", route_to_agents, routing_map)
+        builder.add_conditional_edges("Router", route_to_agents, routing_map)
 
-    builder.add_conditional_edges("Document_qna", route_to_agents, routing_map)
+        builder.add_conditional_edges("Document_qna", route_to_agents, routing_map)
 
-    builder.add_conditional_edges("General_qna", route_to_agents, routing_map)
+        builder.add_conditional_edges("General_qna", route_to_agents, routing_map)
 
-    builder.add_conditional_edges("News", route_to_agents, routing_map)
+        builder.add_conditional_edges("News", route_to_agents, routing_map)
 
-    builder.add_conditional_edges("Image_qna", route_to_agents, routing_map)
+        builder.add_conditional_edges("Image_qna", route_to_agents, routing_map)
 
-    builder.add_conditional_edges("Refiner", route_to_agents, routing_map)
+        builder.add_conditional_edges("Refiner", route_to_agents, routing_map)
 
     builder.add_edge("Aggregator", END)
 
@@ -1,33 +1,67 @@
 import os
-import uuid
+import json
+import asyncio
 import tempfile
-import shutil
 from contextlib import asynccontextmanager
 from typing import Any, List
 
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
 from dotenv import load_dotenv
 
 from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 from langgraph.pregel import Pregel
-from mem0 import MemoryClient
+from mem0 import AsyncMemoryClient
 
 from Graph import BuildGraph, GraphState
+from Tools.vector_cache import vector_store_cache
+from Tools.Doc_QnA_RAG import (
+    remember_file_hash,
+    embeddings_model,
+    faiss_disk_cache,
+    ingestion_jobs,
+    remove_legacy_cache_dirs,
+)
+from Tools.disk_cache import (
+    CACHE_MIN_IDLE,
+    CACHE_SWEEP_INTERVAL,
+    DiskCache,
+    env_hours,
+    env_megabytes,
+    run_sweeper,
+)
+from Tools.Image_qna import textract_disk_cache
+from Tools.news_fetcher import news_fetcher
+from Tools.extraction_pool import extraction_pool
+from Tools.News import NEWS_CACHE_DIR, news_cache
+from upload_store import UploadStore, is_image
 
 load_dotenv()
 
 SQLITE_DB_PATH = os.getenv("SQLITE_DB_PATH", "checkpoints.sqlite")
+# "dag" runs independent agents in parallel, "sequential" walks agent_order one by one
+GRAPH_SCHEDULER = os.getenv("GRAPH_SCHEDULER", "dag")
 
 sqlite_checkpointer: AsyncSqliteSaver | None = None
 graph: Pregel | None = None
-memory_client: MemoryClient | None = None
+memory_client: AsyncMemoryClient | None = None
 memory_manager = None  # Add this global
+upload_store: UploadStore | None = None
+uploads_disk_cache: DiskCache | None = None
+news_disk_cache = DiskCache(
+    "news_cache",
+    NEWS_CACHE_DIR,
+    subdirs=("search", "articles"),
+    max_bytes=env_megabytes("NEWS_CACHE_MAX_MB", 256),
+    max_age=env_hours("NEWS_CACHE_MAX_AGE_HOURS", 48),
+    min_idle=CACHE_MIN_IDLE,
+)
 
 class ConversationMemoryManager:
-    def __init__(self, memory_client: MemoryClient):
+    def __init__(self, memory_client: AsyncMemoryClient):
         self.memory_client = memory_client
         self.conversation_messages = {}
     
@@ -38,7 +72,7 @@ class ConversationMemoryManager:
         try:
             key = self.get_conversation_key(user_id, session_id)
             
-            all_memories = self.memory_client.get_all(user_id=user_id)
+            all_memories = await self.memory_client.get_all(user_id=user_id)
             
             if not all_memories:
                 self.conversation_messages[key] = []
@@ -76,7 +110,7 @@ class ConversationMemoryManager:
                 {"role": "assistant", "content": ai_response}
             ]
             
-            result = self.memory_client.add(
+            result = await self.memory_client.add(
                 conversation_data,
                 user_id=user_id,
                 metadata={"session_id": session_id}
@@ -107,17 +141,38 @@ class ConversationMemoryManager:
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    global sqlite_checkpointer, graph, memory_client, memory_manager
+    global sqlite_checkpointer, graph, memory_client, memory_manager, upload_store, uploads_disk_cache
     
     checkpointer_cm = AsyncSqliteSaver.from_conn_string(SQLITE_DB_PATH)
+    sweeper = None
     try:
         sqlite_checkpointer = await checkpointer_cm.__aenter__()
-        graph = BuildGraph(sqlite_checkpointer)
-        memory_client = MemoryClient()
+        graph = BuildGraph(sqlite_checkpointer, scheduler=GRAPH_SCHEDULER)
+        memory_client = AsyncMemoryClient()
         memory_manager = ConversationMemoryManager(memory_client)  # Initialize here
-        os.makedirs("uploads", exist_ok=True)
+        upload_store = UploadStore("uploads")
+        extraction_pool.start()
+        # 0 disables a limit
+        uploads_disk_cache = DiskCache(
+            "uploads",
+            upload_store.root,
+            max_bytes=env_megabytes("UPLOADS_MAX_MB", 10240),
+            max_age=env_hours("UPLOADS_MAX_AGE_HOURS", 24 * 7),
+            min_idle=CACHE_MIN_IDLE,
+        )
+        await asyncio.to_thread(remove_legacy_cache_dirs)
+        sweeper = asyncio.create_task(
+            run_sweeper(
+                [faiss_disk_cache, textract_disk_cache, news_disk_cache, uploads_disk_cache],
+                CACHE_SWEEP_INTERVAL,
+            )
+        )
         yield
     finally:
+        if sweeper:
+            sweeper.cancel()
+        await news_fetcher.aclose()
+        extraction_pool.shutdown()
         if sqlite_checkpointer:
             await checkpointer_cm.__aexit__(None, None, None)
 
@@ -138,55 +193,178 @@ class MessageRequest(BaseModel):
     user_id: str
     session_id: str
     message: str
+    doc_ids: List[str] = []
 
 def generate_thread_id(user_id: str, session_id: str) -> str:
     return f"{user_id}-{session_id}"
 
-@app.post("/invoke")
-async def invoke_agent(request: MessageRequest):
-    thread_id = generate_thread_id(request.user_id, request.session_id)
-    config = {"configurable": {"thread_id": thread_id}}
-    
-    context = await memory_manager.load_conversation_context(
-        request.user_id, request.session_id
-    )
-    
-    current_messages = memory_manager.get_current_messages(
-        request.user_id, request.session_id
-    )
-    
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def file_paths_for(uploads: List[dict]) -> dict | None:
+    """Upload fields for the graph state, None when the request carries no files"""
+    if not uploads:
+        return None
+    file_paths = {"uploaded_doc": "", "uploaded_docs": [], "uploaded_img": "", "uploaded_imgs": []}
+
+    for meta in uploads:
+        entry = {"doc_id": meta["doc_id"], "name": meta["filename"] or meta["doc_id"], "path": meta["path"]}
+        if is_image(meta):
+            file_paths["uploaded_img"] = meta["path"]
+            file_paths["uploaded_imgs"].append(entry)
+        else:
+            file_paths["uploaded_doc"] = meta["path"]
+            file_paths["uploaded_docs"].append(entry)
+
+    return file_paths
+
+async def save_uploaded_files(files: List[UploadFile]) -> List[dict]:
+    uploads = []
+    for file in files:
+        meta = await upload_store.save(file)
+        # the store already hashed the bytes, Doc_QnA does not need to re-read them
+        remember_file_hash(meta["path"], meta["doc_id"])
+        if not is_image(meta):
+            # ingest in the background, the graph joins this job when asked about it
+            meta = {**meta, "job_id": ingestion_jobs.submit(meta["path"], meta["doc_id"]).job_id}
+        uploads.append(meta)
+    return uploads
+
+def resolve_doc_ids(doc_ids: List[str]) -> List[dict]:
+    uploads = []
+    for doc_id in doc_ids:
+        meta = upload_store.get(doc_id)
+        if meta is None:
+            raise HTTPException(status_code=404, detail=f"Unknown doc_id: {doc_id}")
+        uploads.append(meta)
+    return uploads
+
+def upload_summary(uploads: List[dict]) -> List[dict]:
+    return [
+        {"doc_id": meta["doc_id"], "filename": meta["filename"],
+         "content_type": meta["content_type"], "size": meta["size"],
+         "job_id": meta.get("job_id")}
+        for meta in uploads
+    ]
+
+async def build_initial_state(user_id: str, session_id: str, message: str,
+                              file_paths: dict | None = None) -> GraphState:
+    context = await memory_manager.load_conversation_context(user_id, session_id)
+    current_messages = memory_manager.get_current_messages(user_id, session_id)
+
     initial_state: GraphState = {
-        "input": request.message,
-        "user_id": request.user_id,
-        "session_id": request.session_id,
+        "input": message,
+        "user_id": user_id,
+        "session_id": session_id,
         "messages": current_messages,
         "past_memory": context["past_memory"]
     }
+    if file_paths:
+        # only what this request carries, the checkpoint keeps earlier uploads
+        # (an empty uploaded_docs list would even reset the accumulated ones)
+        for key in ("uploaded_doc", "uploaded_docs", "uploaded_img", "uploaded_imgs"):
+            if file_paths.get(key):
+                initial_state[key] = file_paths[key]
+    return initial_state
+
+async def run_graph(initial_state: GraphState, user_id: str, session_id: str, message: str) -> str:
+    config = {"configurable": {"thread_id": generate_thread_id(user_id, session_id)}}
+
+    final_state = None
+    async for event in graph.astream(initial_state, config=config):
+        if "Aggregator" in event:
+            final_state = event["Aggregator"]
+
+    if not final_state or "final_response" not in final_state:
+        raise HTTPException(status_code=500, detail="Graph did not produce a final response.")
+
+    ai_response = final_state["final_response"]
+    await remember_turn(user_id, session_id, message, ai_response)
+    return ai_response
+
+async def remember_turn(user_id: str, session_id: str, message: str, ai_response: str):
+    memory_manager.add_to_growing_conversation(
+        user_id, session_id, message, ai_response
+    )
+
+    await memory_manager.save_conversation_turn(
+        user_id, session_id, message, ai_response
+    )
+
+async def stream_graph(initial_state: GraphState, user_id: str, session_id: str, message: str,
+                       uploads: List[dict] | None = None):
+    """Yield SSE events: stored files, router decision, each agent finishing, answer tokens, done.
+
+    Answers combined from several agents stream token by token, a single agent's
+    answer arrives as one token event once that agent is done.
+    """
+    config = {"configurable": {"thread_id": generate_thread_id(user_id, session_id)}}
+
+    if uploads:
+        yield sse_event("files", upload_summary(uploads))
 
     try:
-        final_state = None
-        async for event in graph.astream(initial_state, config=config):
-            if "Aggregator" in event:
-                final_state = event["Aggregator"]
+        final_response = None
+        async for mode, chunk in graph.astream(
+            initial_state, config=config, stream_mode=["updates", "custom"]
+        ):
+            if mode == "custom":
+                if chunk.get("token"):
+                    yield sse_event("token", {"content": chunk["token"]})
+                elif chunk.get("partial"):
+                    # map-reduce notes of one part of a document, as each finishes
+                    yield sse_event("partial", chunk["partial"])
+                continue
 
-        if not final_state or "final_response" not in final_state:
-            raise HTTPException(status_code=500, detail="Graph did not produce a final response.")
+            for node, update in chunk.items():
+                update = update or {}
+                if node == "Router":
+                    yield sse_event("router", {
+                        "agents": update.get("agent_order", []),
+                        "reasoning": update.get("routing_reasoning", ""),
+                    })
+                elif node == "Aggregator":
+                    final_response = update.get("final_response")
+                elif node != "Scheduler":
+                    yield sse_event("agent", {"node": node, "status": "done"})
 
-        ai_response = final_state["final_response"]
-        
-        memory_manager.add_to_growing_conversation(
-            request.user_id, request.session_id, request.message, ai_response
-        )
-        
-        await memory_manager.save_conversation_turn(
-            request.user_id, request.session_id, request.message, ai_response
-        )
+        if final_response is None:
+            yield sse_event("error", {"detail": "Graph did not produce a final response."})
+            return
+
+        yield sse_event("done", {"response": final_response})
+        await remember_turn(user_id, session_id, message, final_response)
+
+    except Exception as e:
+        yield sse_event("error", {"detail": f"Graph execution error: {e}"})
+
+@app.post("/invoke")
+async def invoke_agent(request: MessageRequest):
+    file_paths = file_paths_for(resolve_doc_ids(request.doc_ids))
+    initial_state = await build_initial_state(
+        request.user_id, request.session_id, request.message, file_paths
+    )
 
+    try:
+        ai_response = await run_graph(
+            initial_state, request.user_id, request.session_id, request.message
+        )
         return {"response": ai_response}
-        
+
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Graph execution error: {e}")
 
+@app.post("/invoke/stream")
+async def invoke_agent_stream(request: MessageRequest):
+    file_paths = file_paths_for(resolve_doc_ids(request.doc_ids))
+    initial_state = await build_initial_state(
+        request.user_id, request.session_id, request.message, file_paths
+    )
+    return StreamingResponse(
+        stream_graph(initial_state, request.user_id, request.session_id, request.message),
+        media_type="text/event-stream",
+    )
+
 @app.post("/invoke_with_files")
 async def invoke_agent_with_files(
     user_id: str = Form(...),
@@ -197,60 +375,75 @@ async def invoke_agent_with_files(
     if not files:
         raise HTTPException(status_code=400, detail="No files were provided.")
 
-    file_paths = {"uploaded_doc": "", "uploaded_img": ""}
-    
-    for file in files:
-        unique_filename = f"{uuid.uuid4()}-{file.filename}"
-        local_path = os.path.join("uploads", unique_filename)
-        with open(local_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+    uploads = await save_uploaded_files(files)
+    initial_state = await build_initial_state(
+        user_id, session_id, message, file_paths_for(uploads)
+    )
 
-        if 'image' in (file.content_type or ""):
-            file_paths["uploaded_img"] = local_path
-        else:
-            file_paths["uploaded_doc"] = local_path
-    
-    thread_id = generate_thread_id(user_id, session_id)
-    config = {"configurable": {"thread_id": thread_id}}
-    
-    context = await memory_manager.load_conversation_context(user_id, session_id)
-    current_messages = memory_manager.get_current_messages(user_id, session_id)
+    try:
+        ai_response = await run_graph(initial_state, user_id, session_id, message)
+        return {"response": ai_response, "files": upload_summary(uploads)}
 
-    initial_state: GraphState = {
-        "input": message,
-        "user_id": user_id,
-        "session_id": session_id,
-        "uploaded_doc": file_paths.get("uploaded_doc"),
-        "uploaded_img": file_paths.get("uploaded_img"),
-        "messages": current_messages,
-        "past_memory": context["past_memory"]
-    }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Graph execution error with files: {e}")
 
-    try:
-        final_state = None
-        async for event in graph.astream(initial_state, config=config):
-            if "Aggregator" in event:
-                final_state = event["Aggregator"]
+@app.post("/invoke_with_files/stream")
+async def invoke_agent_with_files_stream(
+    user_id: str = Form(...),
+    session_id: str = Form(...),
+    message: str = Form(...),
+    files: List[UploadFile] = File(...)
+):
+    if not files:
+        raise HTTPException(status_code=400, detail="No files were provided.")
 
-        if not final_state or "final_response" not in final_state:
-            raise HTTPException(status_code=500, detail="Graph did not produce a final response.")
+    uploads = await save_uploaded_files(files)
+    initial_state = await build_initial_state(
+        user_id, session_id, message, file_paths_for(uploads)
+    )
+    return StreamingResponse(
+        stream_graph(initial_state, user_id, session_id, message, uploads),
+        media_type="text/event-stream",
+    )
 
-        ai_response = final_state["final_response"]
-        
-        memory_manager.add_to_growing_conversation(
-            user_id, session_id, message, ai_response
-        )
-        
-        await memory_manager.save_conversation_turn(
-            user_id, session_id, message, ai_response
-        )
+@app.post("/upload")
+async def upload_files(files: List[UploadFile] = File(...)):
+    """Store files once and return their doc_ids for later /invoke calls."""
+    if not files:
+        raise HTTPException(status_code=400, detail="No files were provided.")
 
-        return {"response": ai_response}
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Graph execution error with files: {e}")
+    uploads = await save_uploaded_files(files)
+    return {"files": [
+        {**summary, "deduplicated": meta["deduplicated"]}
+        for summary, meta in zip(upload_summary(uploads), uploads)
+    ]}
+
+@app.get("/jobs/{job_id}")
+async def ingestion_job_status(job_id: str):
+    """Status and progress of a document ingestion started by an upload."""
+    job = ingestion_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job_id: {job_id}")
+    return job.to_dict()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {
+        "vector_stores": vector_store_cache.stats(),
+        "embedding": embeddings_model.stats(),
+        "disk": [
+            faiss_disk_cache.stats(),
+            textract_disk_cache.stats(),
+            news_disk_cache.stats(),
+            uploads_disk_cache.stats(),
+        ],
+        "ingestion": ingestion_jobs.stats(),
+        "news_fetch": news_fetcher.stats(),
+        "news_extraction": extraction_pool.stats(),
+        "news_cache": news_cache.stats(),
+    }
 
 if __name__ == "__main__":
-    import uvicorn
-    port = int(os.getenv("PORT", 8000))
-    uvicorn.run("Main:app", host="0.0.0.0", port=port, reload=True)  # Updated module name
+    # not an entry point: spawned worker processes re-import the main module,
+    # which must not be this app with its graph and models (see serve.py)
+    print("Start the server with `python serve.py` or `uvicorn Main:app`")
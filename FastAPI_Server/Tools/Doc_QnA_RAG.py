@@ -170,23 +170,55 @@
 
 import os
 import time
+import json
+import uuid
+import shutil
+import asyncio
 from langchain.tools import tool
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from typing import List, Union
+from typing import Dict, List, Tuple, Union
 from langchain_core.messages import AIMessage, HumanMessage, BaseMessage, SystemMessage
+from langgraph.config import get_stream_writer
 
 # from langchain_huggingface import HuggingFaceEndpointEmbeddings
-from langchain_huggingface import HuggingFaceEmbeddings
 import sentence_transformers
 from langchain_community.vectorstores import FAISS
-from langchain.chains import RetrievalQA
 from langchain_core.prompts import PromptTemplate
 
 # from langchain_core.runnables import RunnableParallel, RunnablePassthrough
 from langchain_google_genai import ChatGoogleGenerativeAI
 from unstract.llmwhisperer import LLMWhispererClientV2
+from pypdf import PdfReader
 import hashlib
 
+from Tools.vector_cache import vector_store_cache
+from Tools.embedding_engine import EmbeddingEngine
+from Tools.quantization import quantize_index
+from Tools.hybrid_retriever import HybridRetriever
+from Tools.query_engine import DocumentQueryEngine
+from Tools.sections import (
+    SECTIONS_VERSION,
+    SectionTracker,
+    section_boundaries,
+    section_for_span,
+)
+from Tools.index_store import (
+    is_compact_index,
+    load_compact_index,
+    merge_compact_indexes,
+    save_compact_index,
+)
+from Tools.disk_cache import (
+    CACHE_MIN_IDLE,
+    DiskCache,
+    env_hours,
+    env_megabytes,
+    remove_path,
+    touch,
+)
+from Tools.ingest_jobs import IngestionJob, IngestionJobs
+from Tools.map_reduce import map_reduce_answer, wants_whole_document
+
 
 # Environment setup
 from dotenv import load_dotenv
@@ -203,11 +235,68 @@ def get_file_hash(file_path: str) -> str:
     return hasher.hexdigest()
 
 
-embeddings_model = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/static-retrieval-mrl-en-v1"
+# (path, size, mtime) -> md5, so follow-up questions do not re-read the whole file
+file_hash_memo = {}
+
+
+def file_hash_key(file_path: str) -> tuple:
+    stat = os.stat(file_path)
+    return (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+
+
+def remember_file_hash(file_path: str, file_hash: str) -> None:
+    """Record a hash computed elsewhere, e.g. while the upload was being written."""
+    if len(file_hash_memo) >= 4096:
+        file_hash_memo.clear()
+    file_hash_memo[file_hash_key(file_path)] = file_hash
+
+
+def cached_file_hash(file_path: str) -> str:
+    """get_file_hash memoized on the file's path, size and modification time."""
+    file_hash = file_hash_memo.get(file_hash_key(file_path))
+    if file_hash is None:
+        file_hash = get_file_hash(file_path)
+        remember_file_hash(file_path, file_hash)
+    return file_hash
+
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/static-retrieval-mrl-en-v1"
+CHUNK_SIZE = 900
+CHUNK_OVERLAP = 200
+# Matryoshka truncation of the stored vectors, 0 keeps the model's full width
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", 0))
+# "none" (float32), "int8" or "binary", see Tools/quantization.py
+INDEX_QUANTIZATION = os.getenv("INDEX_QUANTIZATION", "none")
+# candidates fetched per returned chunk when rescoring a truncated/quantized index
+RESCORE_MULTIPLIER = int(os.getenv("RESCORE_MULTIPLIER", 4))
+# hybrid retrieval: candidates per search, then an adaptive cutoff keeps the chunks
+# within RETRIEVAL_CUTOFF of the best fused score, between MIN_K and MAX_K of them
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", 20))
+RETRIEVAL_MIN_K = int(os.getenv("RETRIEVAL_MIN_K", 4))
+RETRIEVAL_MAX_K = int(os.getenv("RETRIEVAL_MAX_K", 6))
+RETRIEVAL_CUTOFF = float(os.getenv("RETRIEVAL_CUTOFF", 0.5))
+# weight of the dense score against BM25 in the fused score
+HYBRID_DENSE_WEIGHT = float(os.getenv("HYBRID_DENSE_WEIGHT", 0.5))
+# optional local cross-encoder, e.g. "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "")
+# whole-document questions: chunks per map call (in characters) and map calls in flight
+MAP_REDUCE_BATCH_CHARS = int(os.getenv("MAP_REDUCE_BATCH_CHARS", 24000))
+MAP_REDUCE_CONCURRENCY = int(os.getenv("MAP_REDUCE_CONCURRENCY", 8))
+
+embeddings_model = EmbeddingEngine(
+    EMBEDDING_MODEL_NAME,
+    batch_size=int(os.getenv("EMBED_BATCH_SIZE", 64)),
+    workers=int(os.getenv("EMBED_WORKERS", 0)) or None,
+    truncate_dim=EMBEDDING_DIM or None,
 )
 
-text_splitter = RecursiveCharacterTextSplitter(chunk_size=900, chunk_overlap=200)
+reranker = (
+    sentence_transformers.CrossEncoder(RERANK_MODEL, device="cpu") if RERANK_MODEL else None
+)
+
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP
+)
 
 
 model = ChatGoogleGenerativeAI(
@@ -245,88 +334,725 @@ Answer:
 )
 
 
-def pdf_to_text(file_path: str) -> str:
-    """Extract text from PDF using LLM Whisperer"""
-    result = llm_whisperer.whisper(file_path=file_path)
+PAGE_SEPARATOR = "<<<PAGE_BREAK>>>"
+# pages whose text layer is shorter than this are treated as scanned and sent to OCR
+MIN_PAGE_CHARS = 50
+OCR_POLL_INITIAL = 0.5
+OCR_POLL_MAX = 8.0
+OCR_TIMEOUT = 600
+# page number used when OCR output cannot be mapped back to pages
+UNKNOWN_PAGE = 0
+
+
+def page_text(reader: PdfReader, index: int) -> str:
+    return reader.pages[index].extract_text() or ""
+
+
+def open_pdf(file_path: str) -> Union[PdfReader, None]:
+    """PdfReader for the file, None if it cannot be parsed as a PDF"""
+    try:
+        return PdfReader(file_path)
+    except Exception as e:
+        print(f"No local text layer for {file_path}: {e}")
+        return None
+
+
+def is_scanned(text: str) -> bool:
+    return len(text.strip()) < MIN_PAGE_CHARS
+
+
+def ocr_pages_param(page_count: int, missing: List[int]) -> str:
+    """LLMWhisperer pages_to_extract value, empty string means the whole document"""
+    if len(missing) == page_count:
+        return ""
+    return ",".join(str(index + 1) for index in missing)
 
+
+def split_ocr_pages(missing: List[int], ocr_text: str) -> List[Tuple[int, str]]:
+    """Map OCR output back to (page_number, text) for the scanned pages"""
+    ocr_pages = ocr_text.split(PAGE_SEPARATOR)
+    if ocr_pages and not ocr_pages[-1].strip():
+        ocr_pages = ocr_pages[:-1]
+
+    if len(ocr_pages) != len(missing):
+        # Page boundaries got lost, keep everything rather than guess
+        return [(UNKNOWN_PAGE, ocr_text)]
+    return [(index + 1, text) for index, text in zip(missing, ocr_pages)]
+
+
+def poll_delays():
+    """Adaptive backoff between OCR status polls: short at first, capped later"""
+    delay = OCR_POLL_INITIAL
     while True:
+        yield delay
+        delay = min(delay * 1.5, OCR_POLL_MAX)
+
+
+def check_ocr_status(status: dict, started: float) -> bool:
+    """True once processed, raises if the job failed or ran past OCR_TIMEOUT"""
+    if status["status"] == "processed":
+        return True
+    if status["status"] == "error":
+        raise RuntimeError(f"LLM Whisperer extraction failed: {status}")
+    if time.monotonic() - started > OCR_TIMEOUT:
+        raise TimeoutError(f"LLM Whisperer extraction timed out after {OCR_TIMEOUT}s")
+    return False
+
+
+def remote_ocr(file_path: str, pages_to_extract: str = "") -> str:
+    """Extract text using LLM Whisperer"""
+    started = time.monotonic()
+    result = llm_whisperer.whisper(
+        file_path=file_path,
+        pages_to_extract=pages_to_extract,
+        page_seperator=PAGE_SEPARATOR,
+    )
+
+    for delay in poll_delays():
         status = llm_whisperer.whisper_status(whisper_hash=result["whisper_hash"])
-        if status["status"] == "processed":
+        if check_ocr_status(status, started):
             result = llm_whisperer.whisper_retrieve(whisper_hash=result["whisper_hash"])
             return result["extraction"]["result_text"]
-        time.sleep(5)
+        time.sleep(delay)
+
+
+async def aremote_ocr(file_path: str, pages_to_extract: str = "") -> str:
+    """Async variant of remote_ocr, waits between status polls without holding a thread"""
+    started = time.monotonic()
+    result = await asyncio.to_thread(
+        llm_whisperer.whisper,
+        file_path=file_path,
+        pages_to_extract=pages_to_extract,
+        page_seperator=PAGE_SEPARATOR,
+    )
+
+    for delay in poll_delays():
+        status = await asyncio.to_thread(
+            llm_whisperer.whisper_status, whisper_hash=result["whisper_hash"]
+        )
+        if check_ocr_status(status, started):
+            result = await asyncio.to_thread(
+                llm_whisperer.whisper_retrieve, whisper_hash=result["whisper_hash"]
+            )
+            return result["extraction"]["result_text"]
+        await asyncio.sleep(delay)
 
 
-rag_chain = None
+def extract_pages(file_path: str) -> List[Tuple[int, str]]:
+    """(page_number, text) for every page: locally for text-native pages, LLM Whisperer OCR for scanned ones"""
+    reader = open_pdf(file_path)
+    if reader is None:
+        return [(UNKNOWN_PAGE, remote_ocr(file_path))]
+
+    pages, missing = [], []
+    for index in range(len(reader.pages)):
+        text = page_text(reader, index)
+        if is_scanned(text):
+            missing.append(index)
+        else:
+            pages.append((index + 1, text))
+
+    if missing:
+        print(f"Sending {len(missing)}/{len(reader.pages)} scanned pages to OCR")
+        ocr_text = remote_ocr(file_path, ocr_pages_param(len(reader.pages), missing))
+        pages.extend(split_ocr_pages(missing, ocr_text))
+    return sorted(pages)
+
+
+async def aiter_pages(file_path: str):
+    """Async generator variant of extract_pages.
+
+    Text-native pages are yielded as soon as they are read, scanned pages are
+    yielded once the OCR job for all of them finishes, so downstream chunking
+    and embedding overlap with the OCR wait.
+    """
+    reader = await asyncio.to_thread(open_pdf, file_path)
+    if reader is None:
+        yield UNKNOWN_PAGE, await aremote_ocr(file_path)
+        return
+
+    page_count = len(reader.pages)
+    missing = []
+    for index in range(page_count):
+        text = await asyncio.to_thread(page_text, reader, index)
+        if is_scanned(text):
+            missing.append(index)
+        else:
+            yield index + 1, text
+
+    if missing:
+        print(f"Sending {len(missing)}/{page_count} scanned pages to OCR")
+        ocr_text = await aremote_ocr(file_path, ocr_pages_param(page_count, missing))
+        for page in split_ocr_pages(missing, ocr_text):
+            yield page
+
+
+def pdf_to_text(file_path: str) -> str:
+    """Extract the whole document as one string"""
+    return "\n\n".join(text for _, text in extract_pages(file_path))
 
-vector_store = None
 
+rag_chain = None
+
+# Layered cache, each layer only depends on the settings that produce it:
+#   text/<file_hash>.jsonl                     raw extraction, one line per page
+#   chunks/<file_hash>-<splitter>.jsonl        chunks for one splitter config
+#   index/<file_hash>-<splitter>-<model>/      FAISS index for one embedding model (and dim/quantization)
+# so re-chunking or re-embedding never repeats the remote extraction.
 CACHE_DIR = "./faiss_cache"
-os.makedirs(CACHE_DIR, exist_ok=True)
+TEXT_CACHE_DIR = os.path.join(CACHE_DIR, "text")
+CHUNK_CACHE_DIR = os.path.join(CACHE_DIR, "chunks")
+INDEX_CACHE_DIR = os.path.join(CACHE_DIR, "index")
+for cache_dir in (TEXT_CACHE_DIR, CHUNK_CACHE_DIR, INDEX_CACHE_DIR):
+    os.makedirs(cache_dir, exist_ok=True)
+
+
+def remove_legacy_cache_dirs() -> int:
+    """Delete the pickled ``faiss_cache/<md5>/`` indexes of the flat layout used
+    before the text/chunks/index layers. Nothing reads them any more and the
+    sweeper only looks inside the layers, so they are removed once at startup."""
+    removed = 0
+    for name in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, name)
+        if len(name) == 32 and all(c in "0123456789abcdef" for c in name) and os.path.isdir(path):
+            removed += remove_path(path)
+    if removed:
+        print(f"Removed {removed} legacy FAISS cache directories from {CACHE_DIR}")
+    return removed
+
+
+# swept from Main's lifespan, 0 disables a limit
+faiss_disk_cache = DiskCache(
+    "faiss_cache",
+    CACHE_DIR,
+    subdirs=("text", "chunks", "index"),
+    max_bytes=env_megabytes("FAISS_CACHE_MAX_MB", 10240),
+    max_age=env_hours("FAISS_CACHE_MAX_AGE_HOURS", 24 * 30),
+    min_idle=CACHE_MIN_IDLE,
+)
+
+# ingestion pipeline: pages -> chunks -> embedding batches, with bounded queues between
+PAGE_QUEUE_SIZE = 8
+CHUNK_QUEUE_SIZE = 256
+# one full batch per embedding worker per dispatch
+EMBED_BATCH_SIZE = embeddings_model.dispatch_size
+
+
+def short_hash(value: str) -> str:
+    return hashlib.md5(value.encode("utf-8")).hexdigest()[:12]
+
+
+def chunks_cache_key(file_hash: str) -> str:
+    splitter = f"{type(text_splitter).__name__}:{CHUNK_SIZE}:{CHUNK_OVERLAP}:sections{SECTIONS_VERSION}"
+    return f"{file_hash}-{short_hash(splitter)}"
+
+
+def index_cache_key(file_hash: str) -> str:
+    embedding = EMBEDDING_MODEL_NAME
+    if embeddings_model.truncate_dim or INDEX_QUANTIZATION != "none":
+        embedding = f"{embedding}:{embeddings_model.dimension}:{INDEX_QUANTIZATION}"
+    return f"{chunks_cache_key(file_hash)}-{short_hash(embedding)}"
+
+
+def text_cache_path(file_hash: str) -> str:
+    return os.path.join(TEXT_CACHE_DIR, f"{file_hash}.jsonl")
+
+
+def chunk_cache_path(file_hash: str) -> str:
+    return os.path.join(CHUNK_CACHE_DIR, f"{chunks_cache_key(file_hash)}.jsonl")
+
+
+class JsonlCacheWriter:
+    """Append records to a temp file and publish it with a rename on commit,
+    so a cache layer is either complete or absent."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        self.file = open(self.tmp_path, "w", encoding="utf-8")
+
+    def write(self, record: dict) -> None:
+        self.file.write(json.dumps(record) + "\n")
 
+    def commit(self) -> None:
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
 
-def setup_rag_system(file_path: str):
-    """Process PDF and create FAISS vector store"""
-    global vector_store
+    def discard(self) -> None:
+        self.file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
 
-    file_hash = get_file_hash(file_path)
-    cache_path = os.path.join(CACHE_DIR, file_hash)
+
+def read_jsonl(path: str) -> Union[List[dict], None]:
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        # evicted by the disk cache sweeper in the meantime
+        return None
+    except ValueError as e:
+        print(f"Corrupt cache file {path}: {e}. Rebuilding...")
+        return None
+    touch(path)
+    return records
+
+
+def load_cached_pages(file_hash: str) -> Union[List[Tuple[int, str]], None]:
+    records = read_jsonl(text_cache_path(file_hash))
+    if records is None:
+        return None
+    return sorted((record["page"], record["text"]) for record in records)
+
+
+def load_cached_chunks(file_hash: str) -> Union[List[dict], None]:
+    return read_jsonl(chunk_cache_path(file_hash))
+
+
+def split_page(page_number: int, text: str, tracker: SectionTracker) -> List[dict]:
+    """Chunks of one page, each tagged with its page number and section heading"""
+    boundaries = section_boundaries(text, tracker.begin_page(page_number))
+    tracker.end_page(boundaries[-1][1])
+
+    chunks = []
+    cursor = 0
+    for chunk in text_splitter.split_text(text):
+        # chunks overlap, so the next one starts after this one's start
+        start = text.find(chunk, cursor)
+        start = cursor if start < 0 else start
+        cursor = start + 1
+        chunks.append(
+            {
+                "page": page_number,
+                "section": section_for_span(boundaries, start, start + len(chunk)),
+                "text": chunk,
+            }
+        )
+    return chunks
+
+
+def build_query_engine(vector_store, documents: int = 1) -> DocumentQueryEngine:
+    """Retriever and answer chain for a loaded index, built once and cached with it"""
+    retriever = HybridRetriever(
+        vector_store=vector_store,
+        engine=embeddings_model,
+        rescore=bool(embeddings_model.truncate_dim or INDEX_QUANTIZATION != "none"),
+        rescore_multiplier=RESCORE_MULTIPLIER,
+        candidates=RETRIEVAL_CANDIDATES,
+        min_k=RETRIEVAL_MIN_K,
+        # a collection needs room for chunks from each of its documents
+        max_k=min(RETRIEVAL_MAX_K * documents, RETRIEVAL_CANDIDATES),
+        cutoff=RETRIEVAL_CUTOFF,
+        dense_weight=HYBRID_DENSE_WEIGHT,
+        reranker=reranker,
+    )
+    return DocumentQueryEngine(vector_store, retriever, prompt | model)
+
+
+def load_cached_engine(index_key: str, documents: int = 1) -> Union[DocumentQueryEngine, None]:
+    vector_store = load_cached_index(index_key)
+    if vector_store is None:
+        return None
+    return build_query_engine(vector_store, documents)
+
+
+def load_cached_index(index_key: str):
+    """Load the FAISS index cached on disk under this key, None if there is none"""
+    cache_path = os.path.join(INDEX_CACHE_DIR, index_key)
+
+    if os.path.isdir(cache_path) and not is_compact_index(cache_path):
+        # pickled save_local() directory from an older version, rebuilt from the chunk cache
+        print(f"Removing legacy FAISS cache {index_key}")
+        shutil.rmtree(cache_path, ignore_errors=True)
+        return None
 
     # Try loading cached FAISS index
     if os.path.exists(cache_path):
         try:
-            print(f"Loading cached FAISS index for file hash {file_hash}...")
-            vector_store = FAISS.load_local(
-                cache_path, embeddings_model, allow_dangerous_deserialization=True
-            )
+            print(f"Loading cached FAISS index {index_key}...")
+            vector_store = load_compact_index(cache_path, embeddings_model)
+            touch(cache_path)
             print("Loaded cached vector store successfully.")
             return vector_store
         except Exception as e:
             print(f"Failed to load cache: {e}. Reprocessing...")
+    return None
 
-    # Extract text from PDF
-    extracted_text = pdf_to_text(file_path)
-    print("Text Extracted....")
-
-    # Split text
-    chunks = text_splitter.split_text(extracted_text)
-    print("Chunks created....\n")
 
+def add_chunk_batch(vector_store, batch: List[dict]):
+    """Embed one batch of chunks and add it to the index, creating the index on the first batch"""
+    texts = [record["text"] for record in batch]
     metadatas = [
-        {"source": os.path.basename(file_path), "file_hash": file_hash} for _ in chunks
+        {"page": record["page"], "section": record.get("section", "")} for record in batch
     ]
+    text_embeddings = list(zip(texts, embeddings_model.embed_documents(texts)))
+    if vector_store is None:
+        return FAISS.from_embeddings(text_embeddings, embeddings_model, metadatas=metadatas)
+    vector_store.add_embeddings(text_embeddings, metadatas=metadatas)
+    return vector_store
 
-    # Create FAISS index
-    vector_store = FAISS.from_texts(texts=chunks, embedding=embeddings_model)
-    vector_store.save_local(cache_path)
+
+def publish_cache_dir(cache_path: str, write) -> None:
+    """Call write(tmp_path) next to the final path and rename, so readers never see half an index"""
+    tmp_path = f"{cache_path}.{uuid.uuid4().hex}.tmp"
+    write(tmp_path)
+    try:
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        # Another worker already published this index
+        shutil.rmtree(tmp_path, ignore_errors=True)
     print(f"Saved FAISS index cache at {cache_path}")
 
-    return vector_store
+
+def publish_index(file_hash: str, vector_store) -> DocumentQueryEngine:
+    """Save the FAISS index to the cache and keep its query engine in memory"""
+    index_key = index_cache_key(file_hash)
+    cache_path = os.path.join(INDEX_CACHE_DIR, index_key)
+    # built as a flat float index, re-encoded once all vectors are in
+    vector_store.index = quantize_index(vector_store.index, INDEX_QUANTIZATION)
+
+    publish_cache_dir(cache_path, lambda tmp_path: save_compact_index(vector_store, tmp_path))
+
+    # Serve from the memory-mapped copy so the built vectors and texts can be freed
+    try:
+        vector_store = load_compact_index(cache_path, embeddings_model)
+    except Exception as e:
+        print(f"Failed to reopen published index: {e}, keeping the in-memory copy")
+    query_engine = build_query_engine(vector_store)
+    vector_store_cache.put(index_key, query_engine)
+
+    return query_engine
+
+
+def get_chunks(file_path: str, file_hash: str) -> List[dict]:
+    """Chunks for the file, reusing the chunk and text cache layers when possible"""
+    chunks = load_cached_chunks(file_hash)
+    if chunks is not None:
+        return chunks
+
+    pages = load_cached_pages(file_hash)
+    if pages is None:
+        # Extract text from PDF
+        pages = extract_pages(file_path)
+        writer = JsonlCacheWriter(text_cache_path(file_hash))
+        for page_number, text in pages:
+            writer.write({"page": page_number, "text": text})
+        writer.commit()
+        print("Text Extracted....")
+
+    tracker = SectionTracker()
+    chunks = [chunk for page in pages for chunk in split_page(*page, tracker)]
+    writer = JsonlCacheWriter(chunk_cache_path(file_hash))
+    for chunk in chunks:
+        writer.write(chunk)
+    writer.commit()
+    print("Chunks created....\n")
+    return chunks
+
+
+def setup_rag_system(file_path: str) -> Union[DocumentQueryEngine, None]:
+    """Process PDF, create its FAISS vector store and return the query engine over it"""
+    file_hash = cached_file_hash(file_path)
+    index_key = index_cache_key(file_hash)
+
+    cached = vector_store_cache.get_or_load(
+        index_key, lambda: load_cached_engine(index_key)
+    )
+    if cached is not None:
+        touch(os.path.join(INDEX_CACHE_DIR, index_key))
+        return cached
+
+    chunks = get_chunks(file_path, file_hash)
+
+    vector_store = None
+    for start in range(0, len(chunks), EMBED_BATCH_SIZE):
+        vector_store = add_chunk_batch(vector_store, chunks[start : start + EMBED_BATCH_SIZE])
+    if vector_store is None:
+        return None
+    return publish_index(file_hash, vector_store)
+
+
+async def produce_pages(
+    file_path: str, file_hash: str, page_queue: asyncio.Queue, progress: IngestionJob
+):
+    """Pipeline stage 1: pages from the text cache, or extracted and written to it"""
+    cached_pages = await asyncio.to_thread(load_cached_pages, file_hash)
+    if cached_pages is not None:
+        for page in cached_pages:
+            progress.add(pages=1)
+            await page_queue.put(page)
+        await page_queue.put(None)
+        return
+
+    writer = JsonlCacheWriter(text_cache_path(file_hash))
+    try:
+        async for page_number, text in aiter_pages(file_path):
+            writer.write({"page": page_number, "text": text})
+            progress.add(pages=1)
+            await page_queue.put((page_number, text))
+        writer.commit()
+        print("Text Extracted....")
+    except BaseException:
+        writer.discard()
+        raise
+    await page_queue.put(None)
+
+
+async def chunk_pages(
+    file_hash: str, page_queue: asyncio.Queue, chunk_queue: asyncio.Queue, progress: IngestionJob
+):
+    """Pipeline stage 2: split each page as it arrives, writing the chunk cache"""
+    writer = JsonlCacheWriter(chunk_cache_path(file_hash))
+    tracker = SectionTracker()
+    try:
+        while (page := await page_queue.get()) is not None:
+            for chunk in await asyncio.to_thread(split_page, *page, tracker):
+                writer.write(chunk)
+                progress.add(chunks=1)
+                await chunk_queue.put(chunk)
+        writer.commit()
+        print("Chunks created....\n")
+    except BaseException:
+        writer.discard()
+        raise
+    await chunk_queue.put(None)
+
+
+async def embed_chunks(chunk_queue: asyncio.Queue, progress: IngestionJob):
+    """Pipeline stage 3: embed chunks in batches and add them to the index incrementally"""
+    vector_store = None
+    batch = []
+    while True:
+        chunk = await chunk_queue.get()
+        if chunk is not None:
+            batch.append(chunk)
+        if batch and (chunk is None or len(batch) >= EMBED_BATCH_SIZE):
+            vector_store = await asyncio.to_thread(add_chunk_batch, vector_store, batch)
+            progress.add(embedded=len(batch))
+            batch = []
+        if chunk is None:
+            return vector_store
+
+
+async def aingest_document(file_path: str, file_hash: str, progress: IngestionJob):
+    """Run extraction -> chunking -> embedding as a pipeline, returns the new FAISS store"""
+    chunk_queue = asyncio.Queue(maxsize=CHUNK_QUEUE_SIZE)
+
+    cached_chunks = await asyncio.to_thread(load_cached_chunks, file_hash)
+    async with asyncio.TaskGroup() as group:
+        if cached_chunks is not None:
+            progress.set_stage("embedding")
+
+            async def feed_cached_chunks():
+                for chunk in cached_chunks:
+                    progress.add(chunks=1)
+                    await chunk_queue.put(chunk)
+                await chunk_queue.put(None)
+
+            group.create_task(feed_cached_chunks())
+        else:
+            # the stages overlap, this is the first one still running
+            progress.set_stage("extracting")
+            page_queue = asyncio.Queue(maxsize=PAGE_QUEUE_SIZE)
+            group.create_task(produce_pages(file_path, file_hash, page_queue, progress))
+            group.create_task(chunk_pages(file_hash, page_queue, chunk_queue, progress))
+        embedding = group.create_task(embed_chunks(chunk_queue, progress))
+
+    return embedding.result()
+
+
+async def asetup_rag_system(
+    file_path: str, progress: Union[IngestionJob, None] = None
+) -> Union[DocumentQueryEngine, None]:
+    """Async variant of setup_rag_system, ingests new documents through the pipeline.
+
+    Runs as the body of an ingestion job (see ingestion_jobs), which reports
+    its progress on `progress`.
+    """
+    file_hash = await asyncio.to_thread(cached_file_hash, file_path)
+    index_key = index_cache_key(file_hash)
+    progress = progress or IngestionJob(file_hash, file_path)
+
+    progress.set_stage("loading")
+    cached = await asyncio.to_thread(
+        vector_store_cache.get_or_load, index_key, lambda: load_cached_engine(index_key)
+    )
+    if cached is not None:
+        touch(os.path.join(INDEX_CACHE_DIR, index_key))
+        progress.set_stage("cached")
+        return cached
+
+    vector_store = await aingest_document(file_path, file_hash, progress)
+    if vector_store is None:
+        return None
+    progress.set_stage("publishing")
+    query_engine = await asyncio.to_thread(publish_index, file_hash, vector_store)
+    progress.set_stage("published")
+    return query_engine
+
+
+# background ingestion, one in-flight job per document shared by uploads and questions
+ingestion_jobs = IngestionJobs(asetup_rag_system)
+
+
+def cached_engine(file_hash: str) -> Union[DocumentQueryEngine, None]:
+    """Query engine of an already indexed document, None if it still needs ingesting"""
+    index_key = index_cache_key(file_hash)
+    cache_path = os.path.join(INDEX_CACHE_DIR, index_key)
+    query_engine = vector_store_cache.get(index_key)
+    if query_engine is None and is_compact_index(cache_path):
+        query_engine = vector_store_cache.get_or_load(
+            index_key, lambda: load_cached_engine(index_key)
+        )
+    if query_engine is not None:
+        touch(cache_path)
+    return query_engine
+
+
+async def aensure_indexed(file_path: str, file_hash: str) -> Union[DocumentQueryEngine, None]:
+    """Query engine of a document, from the cache when it is indexed already, otherwise
+    from its ingestion job (joining the in-flight one if any)"""
+    query_engine = await asyncio.to_thread(cached_engine, file_hash)
+    if query_engine is not None:
+        return query_engine
+    return await ingestion_jobs.wait(file_path, file_hash)
+
+
+async def aensure_document(file_path: str) -> Union[DocumentQueryEngine, None]:
+    """Query engine of a document, waiting on its in-flight ingestion job if any"""
+    file_hash = await asyncio.to_thread(cached_file_hash, file_path)
+    return await aensure_indexed(file_path, file_hash)
+
+
+def collection_cache_key(index_keys: List[str]) -> str:
+    # order independent, the same set of documents shares one collection
+    return f"collection-{hashlib.md5('|'.join(sorted(index_keys)).encode()).hexdigest()}"
+
+
+def load_collection(collection_key: str, sources: List[Tuple[str, str]]) -> DocumentQueryEngine:
+    """Query engine over the merged index of several documents, merged on first use"""
+    query_engine = load_cached_engine(collection_key, documents=len(sources))
+    if query_engine is not None:
+        return query_engine
+
+    cache_path = os.path.join(INDEX_CACHE_DIR, collection_key)
+    publish_cache_dir(
+        cache_path,
+        lambda tmp_path: merge_compact_indexes(sources, tmp_path, INDEX_QUANTIZATION),
+    )
+    return build_query_engine(load_compact_index(cache_path, embeddings_model), len(sources))
+
+
+async def asetup_collection(file_paths: List[str]) -> Union[DocumentQueryEngine, None]:
+    """One query engine over all the given documents.
+
+    Documents are ingested concurrently into their own (cached, reusable)
+    indexes, which are then merged into a collection index whose chunks carry
+    the doc_id (file hash) of their document. A document that fails to ingest
+    is left out rather than failing the whole collection.
+    """
+    file_hashes = {}
+    for file_path in file_paths:
+        try:
+            file_hash = await asyncio.to_thread(cached_file_hash, file_path)
+        except OSError as e:
+            # evicted from uploads/ or deleted since it was uploaded
+            print(f"Skipping {file_path} in collection: {e}")
+            continue
+        file_hashes.setdefault(file_hash, file_path)
+    if not file_hashes:
+        return None
+    if len(file_hashes) == 1:
+        return await aensure_document(next(iter(file_hashes.values())))
+
+    results = await asyncio.gather(
+        *(
+            aensure_indexed(file_path, file_hash)
+            for file_hash, file_path in file_hashes.items()
+        ),
+        return_exceptions=True,
+    )
+    ready = []
+    for (file_hash, file_path), result in zip(file_hashes.items(), results):
+        if isinstance(result, BaseException) or result is None:
+            print(f"Skipping {file_path} in collection: {result}")
+            continue
+        ready.append((file_hash, result))
+    if len(ready) <= 1:
+        return ready[0][1] if ready else None
+
+    index_keys = [index_cache_key(file_hash) for file_hash, _ in ready]
+    sources = [
+        (os.path.join(INDEX_CACHE_DIR, index_key), file_hash)
+        for index_key, (file_hash, _) in zip(index_keys, ready)
+    ]
+    collection_key = collection_cache_key(index_keys)
+    query_engine = await asyncio.to_thread(
+        vector_store_cache.get_or_load,
+        collection_key,
+        lambda: load_collection(collection_key, sources),
+    )
+    touch(os.path.join(INDEX_CACHE_DIR, collection_key))
+    return query_engine
+
+
+QUERY_PARSING_PROMPT = """You are an expert financial document analyst. Your task is to analyze the given input (which may contain both a query , context from previous analysis , previous message history) and extract the core question about the document.
+
+#     The input may be in formats like:
+#     - "How much is the total revenue for the year 2024?"
+#     - "profit analysis based on: previous step identified focus on Q3 performance metrics"
+#     - "balance sheet ratios context: looking for liquidity analysis from financial news"
+
+#     Guidelines:
+#     1. Parse the input to identify the main question and any contextual information
+#     2. Extract the core question that needs to be answered about the document
+#     3. Identify specific financial metrics, ratios, or analysis areas mentioned
+#     4. Keep context in mind but focus on what specific information is being requested
+#     5. Be concise and direct
+
+#     Output only the refined question - no explanations or additional text."""
+
+
+def stream_writer():
+    """The graph's custom stream writer, a no-op when called outside a graph run"""
+    try:
+        return get_stream_writer()
+    except (RuntimeError, KeyError):
+        # no runnable context at all, or a tool invoked directly rather than by a node
+        return lambda chunk: None
+
+
+def format_history(history: List[BaseMessage]) -> str:
+    """Format message history into a string for model input."""
+    formatted = ""
+    for msg in history[-10:]:
+        role = "User" if isinstance(msg, HumanMessage) else "Assistant"
+        formatted += f"{role}: {msg.content}\n"
+    return formatted.strip()
 
 
 @tool
-def rag_qa_tool(
+async def rag_qa_tool(
     file_path: str,
     query: str,
     dependency_context: str = "",
     message_history: List[Union[AIMessage, HumanMessage]] = [],
+    documents: List[Dict[str, str]] = [],
+    mode: str = "",
 ) -> str:
     """
     Query the processed document using the FAISS-based RAG system with full context.
     Accepts dependency context and prior message history to enable multi-agent reasoning.
+    documents ({"doc_id", "name", "path"} each) queries all of them as one collection.
+    mode "map_reduce" reads every chunk instead of the retrieved ones, for summaries
+    and "list every ..." questions; it is picked automatically when left empty.
     """
 
     print(f"Original Query: {query}")
     print(f"Dependency Context: {dependency_context}")
 
-    def format_history(history: List[BaseMessage]) -> str:
-        """Format message history into a string for model input."""
-        formatted = ""
-        for msg in history[-10:]:
-            role = "User" if isinstance(msg, HumanMessage) else "Assistant"
-            formatted += f"{role}: {msg.content}\n"
-        return formatted.strip()
-
     history_str = format_history(message_history)
 
     full_input = f"""You are analyzing a PDF document as part of a multi-agent pipeline.
@@ -341,53 +1067,52 @@ def rag_qa_tool(
     {history_str}
     """
 
-    query_parsing_prompt = """You are an expert financial document analyst. Your task is to analyze the given input (which may contain both a query , context from previous analysis , previous message history) and extract the core question about the document.
-
-#     The input may be in formats like:
-#     - "How much is the total revenue for the year 2024?"
-#     - "profit analysis based on: previous step identified focus on Q3 performance metrics"
-#     - "balance sheet ratios context: looking for liquidity analysis from financial news"
-
-#     Guidelines:
-#     1. Parse the input to identify the main question and any contextual information
-#     2. Extract the core question that needs to be answered about the document
-#     3. Identify specific financial metrics, ratios, or analysis areas mentioned
-#     4. Keep context in mind but focus on what specific information is being requested
-#     5. Be concise and direct
-
-#     Output only the refined question - no explanations or additional text."""
-
     try:
         query_parsing_messages = [
-            SystemMessage(content=query_parsing_prompt),
+            SystemMessage(content=QUERY_PARSING_PROMPT),
             HumanMessage(content=full_input),
         ]
 
-        refined_query = model.invoke(query_parsing_messages).content.strip()
+        refined_query = (await model.ainvoke(query_parsing_messages)).content.strip()
         print(f"\nRefined query: {refined_query}")
 
-        vector_store = setup_rag_system(file_path=file_path)
+        file_paths = [document["path"] for document in documents] or [file_path]
+        query_engine = await asetup_collection(file_paths)
 
-        if not vector_store:
+        if not query_engine:
             return "Document processing failed. Please upload a valid document."
 
-        rag_chain = RetrievalQA.from_chain_type(
-            llm=model,
-            retriever=vector_store.as_retriever(search_kwargs={"k": 20}),
-            chain_type="stuff",
-            return_source_documents=True,
-            chain_type_kwargs={"prompt": prompt},
-        )
+        sources = {document["doc_id"]: document["name"] for document in documents}
+        document_names = ", ".join(sources.values()) or os.path.basename(file_path)
 
-        context_aware_query = f"""Refined Question: {refined_query}
+        question_context = f"""Refined Question: {refined_query}
+            Documents: {document_names}
             Original Query: {query}
             Dependency Summary: {dependency_context}
-            Chat History Summary: {history_str}
+            Chat History Summary: {history_str}"""
+
+        if mode == "map_reduce" or (not mode and wants_whole_document(refined_query)):
+            # whole-document answers are not held to the 150-word limit below
+            writer = stream_writer()
+            docs = await asyncio.to_thread(query_engine.all_documents)
+            return await map_reduce_answer(
+                model,
+                refined_query,
+                question_context,
+                docs,
+                sources,
+                concurrency=MAP_REDUCE_CONCURRENCY,
+                batch_chars=MAP_REDUCE_BATCH_CHARS,
+                on_partial=lambda partial: writer({"partial": {"node": "Doc_QnA", **partial}}),
+            )
+
+        context_aware_query = f"""{question_context}
             Please provide a detailed 150-word maximum answer using document information only. Include dates, metrics, and be precise.
 """
 
-        result = rag_chain.invoke({"query": context_aware_query})
-        return result["result"]
+        # retrieval uses the refined question, not the history-laden prompt, so
+        # keyword search matches on the tickers, line items and years asked about
+        return await query_engine.aquery(refined_query, context_aware_query, sources)
 
     except Exception as e:
         return f"[ERROR] RAG query processing failed: {str(e)}"
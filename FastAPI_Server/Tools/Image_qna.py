@@ -78,19 +78,129 @@
 
 
 
-import boto3
+import aioboto3
+import asyncio
 import os
+import json
+import uuid
+import hashlib
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.tools import tool
 from langchain_core.messages import HumanMessage, SystemMessage,AIMessage,BaseMessage
 import pprint
-from typing import List, Union
+from typing import Any, Dict, List, Union
+
+from Tools.disk_cache import CACHE_MIN_IDLE, DiskCache, env_hours, env_megabytes, touch
+from Tools.textract_blocks import STRUCTURE_VERSION, format_structure, parse_blocks
+from Tools.image_preprocess import PREPROCESS_TAG, preprocess_image
 
 
 load_dotenv()
 
-textract = boto3.client("textract", region_name="us-east-1")
+aws_session = aioboto3.Session()
+
+# Textract analyses keyed by image content hash, follow-up questions on the
+# same image skip the Textract call
+TEXTRACT_CACHE_DIR = "./textract_cache"
+os.makedirs(TEXTRACT_CACHE_DIR, exist_ok=True)
+
+# swept from Main's lifespan along with faiss_cache and uploads
+textract_disk_cache = DiskCache(
+    "textract_cache",
+    TEXTRACT_CACHE_DIR,
+    max_bytes=env_megabytes("TEXTRACT_CACHE_MAX_MB", 512),
+    max_age=env_hours("TEXTRACT_CACHE_MAX_AGE_HOURS", 24 * 30),
+    min_idle=CACHE_MIN_IDLE,
+)
+
+# images of one request read, preprocessed and sent to Textract at the same time
+IMAGE_CONCURRENCY = int(os.getenv("IMAGE_CONCURRENCY", 4))
+
+
+def read_file_bytes(file_path: str) -> bytes:
+    with open(file_path, "rb") as file:
+        return file.read()
+
+
+def textract_cache_path(image_hash: str) -> str:
+    return os.path.join(
+        TEXTRACT_CACHE_DIR, f"{image_hash}-v{STRUCTURE_VERSION}-{PREPROCESS_TAG}.json"
+    )
+
+
+def load_cached_analysis(image_hash: str) -> Union[Dict[str, Any], None]:
+    path = textract_cache_path(image_hash)
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            structure = json.load(file)
+    except (OSError, ValueError):
+        return None
+    touch(path)
+    return structure
+
+
+def save_analysis(image_hash: str, structure: Dict[str, Any]) -> None:
+    """Write to a temp file and rename, so readers never see half a result"""
+    path = textract_cache_path(image_hash)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(structure, file)
+    os.replace(tmp_path, path)
+
+
+async def analyze_image(file_bytes: bytes) -> Dict[str, Any]:
+    """Forms, tables and lines of an image, from the cache or from Textract.
+
+    Keyed by the uploaded bytes, so a cache hit skips the preprocessing too.
+    """
+    image_hash = hashlib.md5(file_bytes).hexdigest()
+    cached = await asyncio.to_thread(load_cached_analysis, image_hash)
+    if cached is not None:
+        print(f"Textract cache hit for {image_hash}")
+        return cached
+
+    payload = await asyncio.to_thread(preprocess_image, file_bytes)
+    async with aws_session.client("textract", region_name="us-east-1") as textract:
+        response = await textract.analyze_document(
+            Document={"Bytes": payload}, FeatureTypes=["FORMS", "TABLES"]
+        )
+    structure = parse_blocks(response["Blocks"])
+    try:
+        await asyncio.to_thread(save_analysis, image_hash, structure)
+    except OSError as e:
+        print(f"Failed to cache Textract result: {e}")
+    return structure
+
+
+async def analyze_images(images: List[Dict[str, str]]) -> str:
+    """Extracted content of several images ({"name", "path"} each) as one context.
+
+    At most IMAGE_CONCURRENCY images are in memory and in flight at a time; an
+    image that fails is noted in the context instead of failing the others.
+    """
+    semaphore = asyncio.Semaphore(IMAGE_CONCURRENCY)
+
+    async def analyze(image: Dict[str, str]) -> str:
+        async with semaphore:
+            file_bytes = await asyncio.to_thread(read_file_bytes, image["path"])
+            # key-value pairs and table grids stay structured instead of flattened lines
+            return format_structure(await analyze_image(file_bytes))
+
+    results = await asyncio.gather(*(analyze(image) for image in images), return_exceptions=True)
+    if len(images) == 1:
+        if isinstance(results[0], BaseException):
+            raise results[0]
+        return results[0]
+
+    parts = []
+    for number, (image, result) in enumerate(zip(images, results), start=1):
+        if isinstance(result, BaseException):
+            print(f"Image analysis failed for {image['path']}: {result}")
+            result = "[analysis failed]"
+        parts.append(f"--- Image {number}: {image['name']} ---\n{result}")
+    return "\n\n".join(parts)
+
 
 llm = ChatGoogleGenerativeAI(
     model="gemini-2.0-flash", temperature=0, google_api_key=os.getenv("GOOGLE_API_KEY")
@@ -98,26 +208,21 @@ llm = ChatGoogleGenerativeAI(
 
 
 @tool
-def image_qna(uploaded_file, query: str,dependency_context: str = "",
-    message_history: List[Union[AIMessage, HumanMessage]] = [],):
+async def image_qna(uploaded_file, query: str,dependency_context: str = "",
+    message_history: List[Union[AIMessage, HumanMessage]] = [],
+    images: List[Dict[str, str]] = [],):
     """
     Use this tool to answer questions from the uploaded image.
     The query may contain context from previous agent interactions concatenated with the main question and the previous conversation history .
+    images ({"doc_id", "name", "path"} each) analyzes all of them, e.g. the pages of a statement.
     """
 
-    if isinstance(uploaded_file, str):
-        with open(uploaded_file, "rb") as file:
-            file_bytes = file.read()
+    if images:
+        extracted_text = await analyze_images(images)
+    elif isinstance(uploaded_file, str):
+        extracted_text = await analyze_images([{"name": uploaded_file, "path": uploaded_file}])
     else:
-        file_bytes = uploaded_file.read()
-
-    response = textract.analyze_document(
-        Document={"Bytes": file_bytes}, FeatureTypes=["FORMS", "TABLES"]
-    )
-    extracted_text = ""
-    for block in response["Blocks"]:
-        if block["BlockType"] == "LINE":
-            extracted_text += block["Text"] + "\n"
+        extracted_text = format_structure(await analyze_image(uploaded_file.read()))
 
 
     def format_history(history: List[BaseMessage]) -> str:
@@ -165,11 +270,11 @@ def image_qna(uploaded_file, query: str,dependency_context: str = "",
         HumanMessage(content=question)
     ]
 
-    refined_query = llm.invoke(query_parsing_messages).content.strip()
+    refined_query = (await llm.ainvoke(query_parsing_messages)).content.strip()
     print(f"Refined query: {refined_query}")
 
     # Step 2: Analyze the document with context-aware system prompt
-    system_prompt = """You are a financial document analysis tool being used by an agent system. You will be given extracted text from a financial document image and a question to answer.
+    system_prompt = """You are a financial document analysis tool being used by an agent system. You will be given extracted text from a financial document image (or several images, e.g. the pages of one statement, each marked) and a question to answer.
 
     The document could be:
     - Financial statements (balance sheet, income statement, cash flow)
@@ -191,7 +296,7 @@ def image_qna(uploaded_file, query: str,dependency_context: str = "",
     user_prompt = f"Original Input: {query}\nRefined Question: {refined_query}\n\nExtracted Document Text:\n{extracted_text}"
 
     messages = [SystemMessage(content=system_prompt), HumanMessage(content=user_prompt)]
-    response = llm.invoke(messages)
+    response = await llm.ainvoke(messages)
 
     return response.content
 
@@ -2,17 +2,103 @@ import os
 from langchain_core.tools import tool
 from langchain_core.messages import SystemMessage, HumanMessage,AIMessage,BaseMessage
 from langchain_google_genai import ChatGoogleGenerativeAI
-from tavily import TavilyClient
+from tavily import AsyncTavilyClient
 from dotenv import load_dotenv
 from pprint import pprint
-import trafilatura
+import asyncio
 from typing import List, Union
+
+from Tools.news_fetcher import NEWS_FETCH_DEADLINE, gather_until, news_fetcher
+from Tools.news_cache import NewsCache
+from Tools.extraction_pool import extraction_pool
+from Tools.passage_selector import NEWS_CONTEXT_TOKENS, select_passages, trim_articles
+from Tools.Doc_QnA_RAG import embeddings_model
 load_dotenv()
 
-tavily_client = TavilyClient(api_key=os.environ["TAVILY_API_KEY"])
+tavily_client = AsyncTavilyClient(api_key=os.environ["TAVILY_API_KEY"])
+
+# swept from Main's lifespan
+NEWS_CACHE_DIR = "./news_cache"
+news_cache = NewsCache(NEWS_CACHE_DIR)
+
+# everything but the query, part of the search cache key
+NEWS_SEARCH_PARAMS = dict(
+    topic="finance",
+    time_range="month",
+    max_results=3,
+    country="India",
+    include_domains=[
+        "financialexpress.com",
+        "economictimes.indiatimes.com",
+        "livemint.com",
+        "thehindu.com",
+        "wionews.com",
+        "moneycontrol.com",
+        "business-standard.com",
+        "reuters.com",
+        "bloomberg.com"
+    ],
+    exclude_domains=[
+        "reddit.com",
+        "twitter.com",
+        "facebook.com",
+        "X.com",
+        "instagram.com",
+        "youtube.com"
+    ]
+)
+
+
+async def search_news(optimized_query: str) -> dict:
+    """Tavily results for the query, shared by everyone asking it within one cache bucket"""
+    cached = await asyncio.to_thread(news_cache.get_search, optimized_query, NEWS_SEARCH_PARAMS)
+    if cached is not None:
+        print(f"News search cache hit: {optimized_query}")
+        return cached
+
+    response = await tavily_client.search(
+        query=f"latest financial news on {optimized_query}", **NEWS_SEARCH_PARAMS
+    )
+    # empty results are not cached, the next question searches again
+    if response.get("results"):
+        await asyncio.to_thread(news_cache.put_search, optimized_query, NEWS_SEARCH_PARAMS, response)
+    return response
+
+
+async def fetch_article(url: str) -> str | None:
+    """Main text of the article at url, None when it cannot be fetched or extracted.
+
+    Cached text is used as is within its TTL, after that it is revalidated with
+    a conditional request and only re-extracted when the page changed. Stale
+    text is still used when the publisher cannot be reached or the changed
+    page cannot be extracted.
+    """
+    record = await asyncio.to_thread(news_cache.get_article, url)
+    if record is not None and news_cache.is_fresh(record):
+        news_cache.counts["article_hits"] += 1
+        return record["text"]
+
+    response = await news_fetcher.fetch(url, news_cache.validators(record))
+    if response is None:
+        print(f"❌ Could not fetch: {url}")
+        return record["text"] if record is not None else None
+    if response.status_code == 304 and record is not None:
+        news_cache.counts["article_revalidated"] += 1
+        await asyncio.to_thread(news_cache.revalidated, url, record)
+        return record["text"]
+
+    news_cache.counts["article_misses"] += 1
+    # HTML parsing is CPU bound and holds the GIL, it runs in worker processes
+    text = await extraction_pool.extract(response.text)
+    if not text:
+        print(f"❌ Could not extract content from: {url}")
+        # the changed page did not parse, the previous version is better than nothing
+        return record["text"] if record is not None else None
+    await asyncio.to_thread(news_cache.put_article, url, text, response.headers)
+    return text
 
 @tool
-def financial_news_search(query: str,dependency_context: str = "",
+async def financial_news_search(query: str,dependency_context: str = "",
     message_history: List[Union[AIMessage, HumanMessage]] = [],) -> str:
     """
     This tool is used to answer queries which needs latest news feed.
@@ -77,37 +163,11 @@ Output only the optimized search query - no explanations or additional text.
             HumanMessage(content=question)
         ]
         
-        optimized_query = llm.invoke(query_formulation_messages).content.strip()
+        optimized_query = (await llm.ainvoke(query_formulation_messages)).content.strip()
         print(f"Optimized search query: {optimized_query}")
         
         # Step 2: Search using the optimized query
-        enhanced_query = f"latest financial news on {optimized_query}"
-        response = tavily_client.search(
-            query=enhanced_query,
-            topic="finance",
-            time_range="month",
-            max_results=3,
-            country="India",
-            include_domains=[
-                "financialexpress.com",
-                "economictimes.indiatimes.com",
-                "livemint.com",
-                "thehindu.com",
-                "wionews.com",
-                "moneycontrol.com",
-                "business-standard.com",
-                "reuters.com",
-                "bloomberg.com"
-            ],
-            exclude_domains=[
-                "reddit.com",
-                "twitter.com",
-                "facebook.com",
-                "X.com",
-                "instagram.com",
-                "youtube.com"
-            ]
-        )
+        response = await search_news(optimized_query)
         
         if not response.get('results'):
             return f"No recent financial news found for: {optimized_query}"
@@ -116,31 +176,23 @@ Output only the optimized search query - no explanations or additional text.
         urls = [result.get('url') for result in response['results'] if result.get('url')]
         extracted_text = ""
         successful_extractions = []
-        
-        for url in urls:
-            try:
-                downloaded = trafilatura.fetch_url(url)
-                if not downloaded:
-                    print(f"❌ Could not fetch: {url}")
-                    continue
-
-                text = trafilatura.extract(
-                    downloaded,
-                    include_comments=False,
-                    include_tables=False,
-                    include_formatting=False,
-                    date_extraction_params={"extensive_search": True}
-                )
-                
-                if text:
-                    extracted_text += f"\n\n--- Article from {url} ---\n{text}"
-                    successful_extractions.append(url)
-                else:
-                    print(f"❌ Could not extract content from: {url}")
-                    
-            except Exception as e:
-                print(f"Error processing {url}: {str(e)}")
-                continue
+
+        # all articles at once over the shared connection pool, a slow
+        # publisher is dropped at the deadline instead of holding up the answer
+        articles = await gather_until((fetch_article(url) for url in urls), NEWS_FETCH_DEADLINE)
+        # only the passages relevant to the search go to the summarizer, full
+        # articles made prompts of tens of thousands of tokens
+        articles = [(url, text) for url, text in zip(urls, articles) if text]
+        try:
+            articles = await asyncio.to_thread(
+                select_passages, embeddings_model, optimized_query, articles, NEWS_CONTEXT_TOKENS
+            )
+        except Exception as e:
+            print(f"Passage selection failed: {e}, cutting the articles instead")
+            articles = trim_articles(articles, NEWS_CONTEXT_TOKENS)
+        for url, text in articles:
+            extracted_text += f"\n\n--- Article from {url} ---\n{text}"
+            successful_extractions.append(url)
         
         if not extracted_text:
             return f"Could not extract content from any of the found articles for: {optimized_query}"
@@ -167,7 +219,7 @@ Be concise and direct - focus on what matters most for financial decision-making
             HumanMessage(content=analysis_input)
         ]
         
-        analysis_result = llm.invoke(analysis_messages).content
+        analysis_result = (await llm.ainvoke(analysis_messages)).content
         
         # Step 5: Format final result
         final_result = f"""
@@ -0,0 +1,214 @@
+import os
+import time
+import uuid
+import shutil
+import asyncio
+import threading
+from typing import Any, Dict, List, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# in-progress writes (JsonlCacheWriter, publish_index, UploadStore) and deletions
+TEMP_SUFFIXES = (".tmp", ".part", ".deleting")
+# temp files older than this belong to a crashed writer
+TEMP_MAX_AGE = 3600
+
+
+def entry_files(path: str) -> List[str]:
+    """Files whose times stand for the entry. A directory's own atime changes
+    whenever it is listed, including by the sweeper, so its files are used."""
+    if not os.path.isdir(path):
+        return [path]
+    return [
+        os.path.join(dirpath, filename)
+        for dirpath, _, filenames in os.walk(path)
+        for filename in filenames
+    ]
+
+
+def touch(path: str) -> None:
+    """Record an access by bumping atime only.
+
+    Set explicitly, so it works on noatime/relatime mounts, and mtime is left
+    alone because uploads are hash-memoized on (path, size, mtime).
+    """
+    try:
+        for file_path in entry_files(path):
+            stat = os.stat(file_path)
+            os.utime(file_path, ns=(time.time_ns(), stat.st_mtime_ns))
+    except OSError:
+        pass
+
+
+def last_access(path: str) -> float:
+    # an empty directory is one whose writer has just created it
+    latest = os.stat(path).st_mtime
+    for file_path in entry_files(path):
+        stat = os.stat(file_path)
+        latest = max(latest, stat.st_atime, stat.st_mtime)
+    return latest
+
+
+def path_bytes(path: str) -> int:
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return size
+
+
+def remove_path(path: str) -> bool:
+    """Delete a file or directory, safe against concurrent readers and sweepers.
+
+    The entry is first renamed aside, which is atomic: readers either find the
+    whole entry or nothing, files they already opened (mmapped indexes, SQLite
+    connections) stay valid, and only one of several sweepers wins the rename.
+    """
+    doomed = f"{path}.{uuid.uuid4().hex}.deleting"
+    try:
+        os.replace(path, doomed)
+    except OSError:
+        return False
+    if os.path.isdir(doomed):
+        shutil.rmtree(doomed, ignore_errors=True)
+    else:
+        try:
+            os.remove(doomed)
+        except OSError:
+            pass
+    return True
+
+
+class DiskCache:
+    """Byte and age limits for a cache directory, evicting least recently used first.
+
+    Entries are the children of ``subdirs``. Files sharing a stem
+    (``<doc_id>.pdf`` and its ``<doc_id>.meta.json`` sidecar) are one entry and
+    are removed together, sidecars first so the entry disappears from lookups
+    before its data does. Entries accessed within ``min_idle`` seconds are never
+    removed, so a request that just resolved a path can still use it.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        root: str,
+        subdirs: Tuple[str, ...] = ("",),
+        max_bytes: int = 0,
+        max_age: float = 0,
+        min_idle: float = 600,
+    ):
+        self.name = name
+        self.root = root
+        self.subdirs = subdirs
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.min_idle = min_idle
+        self._lock = threading.Lock()
+        self.last_sweep: Dict[str, Any] = {}
+
+    def scan(self) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """(entries, stale temp paths) currently under the cache root"""
+        entries: Dict[str, Dict[str, Any]] = {}
+        temps = []
+        now = time.time()
+        for subdir in self.subdirs:
+            directory = os.path.join(self.root, subdir)
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    if name.endswith(TEMP_SUFFIXES):
+                        if now - last_access(path) > TEMP_MAX_AGE:
+                            temps.append(path)
+                        continue
+                    key = os.path.join(subdir, name.split(".", 1)[0])
+                    entry = entries.setdefault(key, {"key": key, "paths": [], "bytes": 0, "last_access": 0.0})
+                    entry["paths"].append(path)
+                    entry["bytes"] += path_bytes(path)
+                    entry["last_access"] = max(entry["last_access"], last_access(path))
+                except OSError:
+                    # removed while scanning
+                    continue
+        for entry in entries.values():
+            entry["paths"].sort(
+                key=lambda path: (not path.endswith(".meta.json"), not path.endswith(".json"))
+            )
+        return list(entries.values()), temps
+
+    def sweep(self) -> Dict[str, Any]:
+        with self._lock:
+            started = time.time()
+            entries, temps = self.scan()
+            total = sum(entry["bytes"] for entry in entries)
+
+            removed_temps = sum(remove_path(path) for path in temps)
+            removed = 0
+            freed = 0
+            for entry in sorted(entries, key=lambda entry: entry["last_access"]):
+                idle = started - entry["last_access"]
+                expired = self.max_age and idle > self.max_age
+                over_budget = self.max_bytes and total > self.max_bytes
+                if not (expired or over_budget):
+                    continue
+                if idle < self.min_idle:
+                    # oldest first, so everything after this is in use as well
+                    break
+                if all([remove_path(path) for path in entry["paths"]]):
+                    removed += 1
+                total -= entry["bytes"]
+                freed += entry["bytes"]
+
+            self.last_sweep = {
+                "entries": len(entries) - removed,
+                "bytes": total,
+                "max_bytes": self.max_bytes,
+                "max_age_seconds": self.max_age,
+                "evicted": removed,
+                "evicted_bytes": freed,
+                "stale_temp_removed": removed_temps,
+                "swept_at": started,
+                "seconds": round(time.time() - started, 3),
+            }
+            if removed or removed_temps:
+                print(
+                    f"Disk cache {self.name}: evicted {removed} entries ({freed} bytes), "
+                    f"{removed_temps} stale temp files, {total} bytes left"
+                )
+            return self.last_sweep
+
+    def stats(self) -> Dict[str, Any]:
+        return {"name": self.name, "root": self.root, **self.last_sweep}
+
+
+async def run_sweeper(caches: List[DiskCache], interval: float) -> None:
+    """Sweep every cache now and then every `interval` seconds until cancelled"""
+    while True:
+        for cache in caches:
+            try:
+                await asyncio.to_thread(cache.sweep)
+            except Exception as e:
+                print(f"Disk cache sweep of {cache.name} failed: {e}")
+        await asyncio.sleep(interval)
+
+
+def env_megabytes(name: str, default: int) -> int:
+    return int(os.getenv(name, default)) * 1024 * 1024
+
+
+def env_hours(name: str, default: float) -> float:
+    return float(os.getenv(name, default)) * 3600
+
+
+CACHE_MIN_IDLE = float(os.getenv("CACHE_MIN_IDLE_SECONDS", 600))
+CACHE_SWEEP_INTERVAL = float(os.getenv("CACHE_SWEEP_INTERVAL_SECONDS", 600))
@@ -0,0 +1,132 @@
+import os
+import time
+import atexit
+import threading
+from typing import Any, Dict, List
+
+from langchain_core.embeddings import Embeddings
+from sentence_transformers import SentenceTransformer
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class EmbeddingEngine(Embeddings):
+    """Sentence-transformers embeddings with batched, multi-process document encoding.
+
+    Small inputs (queries, a single page) are encoded in-process. Inputs of at
+    least ``multi_process_min`` texts, capped at ``dispatch_size`` so the
+    batches ingestion hands over qualify, are spread over a pool of worker
+    processes, one per core by default, which is started on first use and kept
+    alive.
+
+    With ``truncate_dim`` set, vectors are cut to their first ``truncate_dim``
+    dimensions (Matryoshka models keep most of their quality in the leading
+    dimensions). ``encode(..., full=True)`` still returns full-width vectors,
+    which is what rescoring of quantized search results uses.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        batch_size: int = 64,
+        workers: int | None = None,
+        multi_process_min: int = 512,
+        truncate_dim: int | None = None,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.multi_process_min = min(multi_process_min, self.dispatch_size)
+        self.model = SentenceTransformer(model_name, device="cpu")
+        # renamed in sentence-transformers 6, the requirement is unpinned
+        get_dimension = getattr(self.model, "get_embedding_dimension", None)
+        full_dim = (get_dimension or self.model.get_sentence_embedding_dimension)()
+        self.truncate_dim = truncate_dim if truncate_dim and truncate_dim < full_dim else None
+        self.dimension = self.truncate_dim or full_dim
+
+        self._pool = None
+        # the pool's input/output queues are shared, one encode call at a time
+        self._pool_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.texts_embedded = 0
+        self.seconds_embedding = 0.0
+        self.calls = 0
+
+    @property
+    def dispatch_size(self) -> int:
+        """Texts to hand over per call so every worker gets a full batch."""
+        return self.batch_size * self.workers
+
+    def _get_pool(self):
+        if self._pool is None:
+            print(f"Starting embedding pool with {self.workers} workers")
+            self._pool = self.model.start_multi_process_pool(["cpu"] * self.workers)
+            atexit.register(self.close)
+        return self._pool
+
+    def close(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self.model.stop_multi_process_pool(self._pool)
+                self._pool = None
+
+    def encode(self, texts: List[str], full: bool = False):
+        if self.workers > 1 and len(texts) >= self.multi_process_min:
+            with self._pool_lock:
+                # pool start up is not part of the measured throughput
+                pool = self._get_pool()
+                started = time.perf_counter()
+                vectors = self.model.encode(
+                    texts,
+                    batch_size=self.batch_size,
+                    pool=pool,
+                    chunk_size=max(self.batch_size, len(texts) // self.workers + 1),
+                )
+        else:
+            started = time.perf_counter()
+            vectors = self.model.encode(texts, batch_size=self.batch_size)
+        elapsed = time.perf_counter() - started
+
+        with self._stats_lock:
+            self.calls += 1
+            self.texts_embedded += len(texts)
+            self.seconds_embedding += elapsed
+        if len(texts) >= self.batch_size:
+            print(
+                f"Embedded {len(texts)} chunks in {elapsed:.2f}s "
+                f"({len(texts) / max(elapsed, 1e-9):.1f} chunks/s)"
+            )
+        if self.truncate_dim and not full:
+            vectors = vectors[:, : self.truncate_dim]
+        return vectors
+
+    def encode_inline(self, texts: List[str], full: bool = False):
+        """In-process encoding for query-time scoring, not counted as ingestion"""
+        vectors = self.model.encode(texts, batch_size=self.batch_size)
+        if self.truncate_dim and not full:
+            vectors = vectors[:, : self.truncate_dim]
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.encode([text])[0][: self.dimension].tolist()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            return {
+                "model": self.model_name,
+                "dimension": self.dimension,
+                "batch_size": self.batch_size,
+                "workers": self.workers,
+                "calls": self.calls,
+                "chunks_embedded": self.texts_embedded,
+                "seconds": round(self.seconds_embedding, 3),
+                "chunks_per_second": round(
+                    self.texts_embedded / self.seconds_embedding, 1
+                )
+                if self.seconds_embedding
+                else 0.0,
+            }
@@ -0,0 +1,163 @@
+import os
+import time
+import asyncio
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Optional, Tuple
+
+import trafilatura
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# processes parsing article HTML, kept apart from the event loop and its threads
+NEWS_EXTRACT_WORKERS = int(os.getenv("NEWS_EXTRACT_WORKERS", min(2, os.cpu_count() or 1)))
+# extractions allowed to wait for a free worker, callers beyond that wait in the event loop
+NEWS_EXTRACT_QUEUE = int(os.getenv("NEWS_EXTRACT_QUEUE", 16))
+
+
+def extract_article_text(html: str) -> Tuple[Optional[str], float]:
+    """(main text, CPU seconds spent), runs in a pool worker"""
+    started = time.process_time()
+    text = trafilatura.extract(
+        html,
+        include_comments=False,
+        include_tables=False,
+        include_formatting=False,
+        date_extraction_params={"extensive_search": True},
+    )
+    return text, time.process_time() - started
+
+
+def warm_up() -> None:
+    """Imports done, the first real article does not pay for them"""
+
+
+class ExtractionPool:
+    """Article extraction in a dedicated process pool with a bounded queue.
+
+    At most ``workers + queue`` extractions are handed to the pool at once, a
+    slot is only freed when the worker is done with it (also when the caller
+    gave up at its deadline), so the pool's backlog never grows unbounded.
+    """
+
+    def __init__(
+        self,
+        workers: int = NEWS_EXTRACT_WORKERS,
+        queue: int = NEWS_EXTRACT_QUEUE,
+    ):
+        self.workers = workers
+        self.queue = queue
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.started_at = time.time()
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+    def start(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn, the server process has threads and loaded models a fork would copy.
+            # Workers start once and stay. Each imports the parent's main module, which
+            # is the small serve.py / uvicorn launcher, never Main.py (see serve.py)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            self.started_at = time.time()
+            for _ in range(self.workers):
+                self._pool.submit(warm_up)
+        return self._pool
+
+    def slots(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._slots is None or self._loop is not loop:
+            self._slots = asyncio.Semaphore(self.workers + self.queue)
+            self._loop = loop
+        return self._slots
+
+    def _on_done(
+        self, loop: asyncio.AbstractEventLoop, slots: asyncio.Semaphore, future: Future
+    ) -> None:
+        # called from the pool's management thread, the bookkeeping belongs to the loop
+        try:
+            loop.call_soon_threadsafe(self._finished, slots, future)
+        except RuntimeError:
+            pass  # loop already closed
+
+    def _finished(self, slots: asyncio.Semaphore, future: Future) -> None:
+        self.in_flight -= 1
+        slots.release()
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            self.failed += 1
+            return
+        self.completed += 1
+        self.busy_seconds += future.result()[1]
+
+    async def extract(self, html: str) -> Optional[str]:
+        """Main text of an article page, None when nothing could be extracted"""
+        loop = asyncio.get_running_loop()
+        slots = self.slots()
+        self.waiting += 1
+        try:
+            await slots.acquire()
+        finally:
+            self.waiting -= 1
+
+        pool = self.start()
+        try:
+            future = pool.submit(extract_article_text, html)
+        except BrokenProcessPool as e:
+            slots.release()
+            self.broken(pool, e)
+            return None
+        except BaseException:
+            slots.release()
+            raise
+        self.in_flight += 1
+        future.add_done_callback(lambda done: self._on_done(loop, slots, done))
+        try:
+            text, _ = await asyncio.wrap_future(future)
+        except BrokenProcessPool as e:
+            self.broken(pool, e)
+            return None
+        except Exception as e:
+            print(f"Article extraction failed: {e}")
+            return None
+        return text
+
+    def broken(self, pool: ProcessPoolExecutor, error: Exception) -> None:
+        # a worker died (e.g. out of memory), the next extraction starts a fresh pool
+        if self._pool is pool:
+            print(f"Extraction pool broken: {error}")
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        uptime = max(time.time() - self.started_at, 1e-9)
+        return {
+            "workers": self.workers,
+            "queue_limit": self.queue,
+            "running": min(self.in_flight, self.workers),
+            "queued": max(0, self.in_flight - self.workers),
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "busy_seconds": round(self.busy_seconds, 3),
+            # share of the workers' time spent extracting since the pool started
+            "utilization": round(self.busy_seconds / (self.workers * uptime), 4),
+        }
+
+
+extraction_pool = ExtractionPool()
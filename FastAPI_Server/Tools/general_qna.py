@@ -12,7 +12,7 @@ llm = ChatGoogleGenerativeAI(
 )
 
 @tool
-def gen_qna(question: str, dependency_context: str = "",
+async def gen_qna(question: str, dependency_context: str = "",
     message_history: List[Union[AIMessage, HumanMessage]] = [],) -> str:
     """
     This tool is used for answering general questions.
@@ -50,7 +50,7 @@ def gen_qna(question: str, dependency_context: str = "",
         HumanMessage(content=structured_prompt)
     ]
 
-    response = llm.invoke(messages)
+    response = await llm.ainvoke(messages)
     return response.content
 
 
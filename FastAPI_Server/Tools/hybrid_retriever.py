@@ -0,0 +1,144 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from Tools.index_store import search_ids
+from Tools.quantization import rescore_documents
+from Tools.sections import query_filters
+
+ScoredDocs = List[Tuple[Document, float]]
+
+
+def doc_key(doc: Document) -> str:
+    # dense and keyword hits of the same chunk share the docstore id
+    return doc.id or doc.page_content
+
+
+def normalize_scores(scored: ScoredDocs) -> Dict[str, float]:
+    """doc id -> score min-max scaled to [0, 1] within one result list"""
+    if not scored:
+        return {}
+    scores = [score for _, score in scored]
+    low, high = min(scores), max(scores)
+    if high == low:
+        return {doc_key(doc): 1.0 for doc, _ in scored}
+    return {doc_key(doc): (score - low) / (high - low) for doc, score in scored}
+
+
+def fuse_scores(dense: ScoredDocs, lexical: ScoredDocs, dense_weight: float) -> ScoredDocs:
+    """Relative score fusion: weighted sum of the normalized scores of both lists,
+    a chunk missing from one list scores 0 there."""
+    dense_scores = normalize_scores(dense)
+    lexical_scores = normalize_scores(lexical)
+    docs = {doc_key(doc): doc for doc, _ in lexical}
+    docs.update({doc_key(doc): doc for doc, _ in dense})
+
+    fused = [
+        (
+            doc,
+            dense_weight * dense_scores.get(doc_id, 0.0)
+            + (1 - dense_weight) * lexical_scores.get(doc_id, 0.0),
+        )
+        for doc_id, doc in docs.items()
+    ]
+    return sorted(fused, key=lambda pair: pair[1], reverse=True)
+
+
+def adaptive_cutoff(scored: ScoredDocs, min_k: int, max_k: int, ratio: float) -> List[Document]:
+    """Keep chunks scoring at least ratio * best score, but no fewer than min_k
+    and no more than max_k."""
+    if not scored:
+        return []
+    best = scored[0][1]
+    keep = sum(1 for _, score in scored if score >= ratio * best)
+    keep = max(min_k, min(keep, max_k))
+    return [doc for doc, _ in scored[:keep]]
+
+
+class HybridRetriever(BaseRetriever):
+    """BM25 keyword search and dense vector search, fused and cut off adaptively.
+
+    When the query names pages or sections ("balance sheet", "page 12") and the
+    docstore can filter on them, both searches only consider matching chunks.
+    Dense candidates are rescored at full precision when the index is truncated
+    or quantized. Keyword search needs the SQLite docstore of a compact index and
+    is skipped for stores without one. With a cross-encoder ``reranker`` the
+    fused candidates are re-ranked by it before the cutoff.
+    """
+
+    vector_store: Any
+    engine: Any
+    rescore: bool = False
+    rescore_multiplier: int = 4
+    candidates: int = 20
+    min_k: int = 4
+    max_k: int = 6
+    cutoff: float = 0.5
+    dense_weight: float = 0.5
+    reranker: Any = None
+
+    def dense_search(self, query: str, ids: Optional[List[int]] = None) -> ScoredDocs:
+        fetch = self.candidates * self.rescore_multiplier if self.rescore else self.candidates
+        if ids is None:
+            results = self.vector_store.similarity_search_with_score(query, k=fetch)
+        else:
+            vector = np.asarray([self.engine.embed_query(query)], dtype="float32")
+            hits = search_ids(self.vector_store.index, vector, fetch, ids)
+            docs = self.vector_store.docstore.fetch([str(position) for position, _ in hits])
+            results = list(zip(docs, (distance for _, distance in hits)))
+
+        if self.rescore:
+            results = rescore_documents(self.engine, query, [doc for doc, _ in results])
+            results = results[: self.candidates]
+        # L2 distance, lower is better
+        return [(doc, -distance) for doc, distance in results]
+
+    def keyword_search(self, query: str, ids: Optional[List[int]] = None) -> ScoredDocs:
+        keyword_search = getattr(self.vector_store.docstore, "keyword_search", None)
+        if keyword_search is None:
+            return []
+        return keyword_search(query, self.candidates, ids)
+
+    def filter_ids(self, query: str) -> Optional[List[int]]:
+        """Chunk ids matching the pages/sections named in query, None to search everything"""
+        filter_ids = getattr(self.vector_store.docstore, "filter_ids", None)
+        pages, sections = query_filters(query)
+        if filter_ids is None or not (pages or sections):
+            return None
+        ids = filter_ids(pages, sections)
+        if not ids:
+            print(f"No chunks for pages {pages} / sections {sections}, searching everything")
+            return None
+        print(f"Filtered to {len(ids)} chunks on pages {pages} / sections {sections}")
+        return ids
+
+    def rerank(self, query: str, docs: List[Document]) -> ScoredDocs:
+        scores = self.reranker.predict([(query, doc.page_content) for doc in docs])
+        scored = [(doc, float(score)) for doc, score in zip(docs, scores)]
+        # cross-encoder logits can be negative, the cutoff ratio needs [0, 1]
+        normalized = normalize_scores(scored)
+        return sorted(
+            ((doc, normalized[doc_key(doc)]) for doc, _ in scored),
+            key=lambda pair: pair[1],
+            reverse=True,
+        )
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        ids = self.filter_ids(query)
+        dense = self.dense_search(query, ids)
+        lexical = self.keyword_search(query, ids)
+        fused = fuse_scores(dense, lexical, self.dense_weight)[: self.candidates]
+        if self.reranker is not None and fused:
+            fused = self.rerank(query, [doc for doc, _ in fused])
+
+        docs = adaptive_cutoff(fused, self.min_k, self.max_k, self.cutoff)
+        print(
+            f"Retrieved {len(docs)} chunks ({len(dense)} dense, {len(lexical)} keyword candidates)"
+        )
+        return docs
@@ -0,0 +1,71 @@
+import io
+import os
+import math
+
+from PIL import Image, ImageOps
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# longest side sent to Textract, 0 sends the uploaded bytes unchanged. Phone
+# photos are 4000px+, text stays well above Textract's minimum height at 2500
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", 2500))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", 85))
+# JPEGs may be decoded at 1/2, 1/4 or 1/8 scale as long as the longest side
+# keeps this share of IMAGE_MAX_SIDE, a 4032x3024 photo decodes at 2016x1512
+DRAFT_MIN_RATIO = 0.8
+# part of the Textract cache key, results of differently prepared images differ
+PREPROCESS_TAG = (
+    f"gray{IMAGE_MAX_SIDE}q{IMAGE_JPEG_QUALITY}d{DRAFT_MIN_RATIO}" if IMAGE_MAX_SIDE else "raw"
+)
+
+
+def flatten_alpha(image: Image.Image) -> Image.Image:
+    # transparent areas would turn black in grayscale, put them on white paper
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        image = image.convert("RGBA")
+        background = Image.new("RGBA", image.size, "white")
+        return Image.alpha_composite(background, image)
+    return image
+
+
+def draft_size(size: tuple) -> tuple:
+    """Smallest size JPEG draft decoding may reduce to, same aspect ratio as size.
+
+    draft() only picks a scale at which both sides stay at least the requested
+    size, so the request has to follow the image's shape.
+    """
+    width, height = size
+    scale = IMAGE_MAX_SIDE * DRAFT_MIN_RATIO / max(width, height)
+    if scale >= 1:
+        return size
+    return math.ceil(width * scale), math.ceil(height * scale)
+
+
+def preprocess_image(file_bytes: bytes) -> bytes:
+    """Upright (EXIF orientation), grayscale, downscaled JPEG of an image for OCR.
+
+    Returns the original bytes when they cannot be decoded or are already
+    smaller than the processed version.
+    """
+    if not IMAGE_MAX_SIDE:
+        return file_bytes
+    try:
+        with Image.open(io.BytesIO(file_bytes)) as image:
+            # JPEGs are decoded at a reduced scale straight away, much cheaper
+            # than decoding all 12+ megapixels and resizing afterwards
+            image.draft("L", draft_size(image.size))
+            image = ImageOps.exif_transpose(image)
+            image = flatten_alpha(image).convert("L")
+            image.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE), Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, "JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True)
+    except Exception as e:
+        print(f"Image preprocessing failed, sending the original: {e}")
+        return file_bytes
+
+    processed = output.getvalue()
+    if len(processed) >= len(file_bytes):
+        return file_bytes
+    print(f"Preprocessed image: {len(file_bytes)} -> {len(processed)} bytes")
+    return processed
@@ -0,0 +1,250 @@
+import os
+import re
+import json
+import sqlite3
+import threading
+from collections.abc import Mapping
+from typing import Any, Iterable, Iterator, List, Optional, Tuple, Union
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from Tools.quantization import merge_indexes
+
+# On-disk layout of one cached index directory:
+#   index.faiss    raw FAISS index, memory-mapped on load
+#   chunks.sqlite  chunk text + metadata, row id = position in the FAISS index,
+#                  plus an FTS5 table over the text for BM25 keyword search
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "chunks.sqlite"
+
+# zero-copy mapping of flat/quantized code arrays (faiss >= 1.10), older
+# versions fall back to the plain mmap flag
+MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+# left out of keyword queries, BM25 would weigh them low anyway but they widen the match
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the "
+    "this to was were what when where which who why will with".split()
+)
+
+
+def keyword_query(text: str) -> str:
+    """FTS5 MATCH expression OR-ing the distinct terms of text, each quoted so
+    tickers and numbers are matched literally."""
+    terms = dict.fromkeys(
+        term for term in re.findall(r"\w+", text.lower()) if term not in STOPWORDS
+    )
+    return " OR ".join(f'"{term}"' for term in terms)
+
+
+class PositionIds(Mapping):
+    """index_to_docstore_id for a store whose chunk ids are their index positions,
+    so no per-chunk mapping has to be built on load."""
+
+    def __init__(self, size: int):
+        self.size = size
+
+    def __getitem__(self, position: int) -> str:
+        if not 0 <= position < self.size:
+            raise KeyError(position)
+        return str(position)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(range(self.size))
+
+    def __len__(self) -> int:
+        return self.size
+
+
+class SqliteDocstore(Docstore):
+    """Read-only docstore backed by a SQLite file, chunks are fetched by id on demand."""
+
+    def __init__(self, path: str):
+        self.path = path
+        # published stores never change, immutable=1 skips SQLite's file locking
+        self._conn = sqlite3.connect(
+            f"file:{path}?mode=ro&immutable=1", uri=True, check_same_thread=False
+        )
+        self._lock = threading.Lock()
+        # stores written before keyword search existed have no FTS table
+        self.has_keyword_index = (
+            self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'"
+            ).fetchone()
+            is not None
+        )
+
+    def search(self, search: str) -> Union[str, Document]:
+        documents = self.fetch([search])
+        return documents[0] if documents else f"ID {search} not found."
+
+    def fetch(self, ids: List[str]) -> List[Document]:
+        """Documents for the given ids in the given order, unknown ids are skipped."""
+        positions = [int(doc_id) for doc_id in ids if str(doc_id).isdigit()]
+        if not positions:
+            return []
+        placeholders = ",".join("?" * len(positions))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, text, metadata FROM chunks WHERE id IN ({placeholders})",
+                positions,
+            ).fetchall()
+        by_id = {
+            row_id: Document(id=str(row_id), page_content=text, metadata=json.loads(metadata))
+            for row_id, text, metadata in rows
+        }
+        return [by_id[position] for position in positions if position in by_id]
+
+    def filter_ids(self, pages: List[int], sections: List[str]) -> List[int]:
+        """Ids of the chunks on any of pages and in any of sections (an empty list
+        does not filter on that field)."""
+        conditions = []
+        params: List[Any] = []
+        for field, values in (("page", pages), ("section", sections)):
+            if values:
+                conditions.append(
+                    f"json_extract(metadata, '$.{field}') IN ({','.join('?' * len(values))})"
+                )
+                params.extend(values)
+        if not conditions:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id FROM chunks WHERE {' AND '.join(conditions)}", params
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def keyword_search(
+        self, query: str, k: int, ids: Optional[List[int]] = None
+    ) -> List[Tuple[Document, float]]:
+        """Top k chunks by BM25, as (doc, score) with higher scores better,
+        optionally only among the given chunk ids."""
+        match = keyword_query(query)
+        if not self.has_keyword_index or not match:
+            return []
+        restrict = ""
+        params: List[Any] = [match]
+        if ids is not None:
+            restrict = f" AND chunks.id IN ({','.join('?' * len(ids))})"
+            params.extend(ids)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunks.id, chunks.text, chunks.metadata, bm25(chunks_fts) AS rank "
+                "FROM chunks_fts JOIN chunks ON chunks.id = chunks_fts.rowid "
+                f"WHERE chunks_fts MATCH ?{restrict} ORDER BY rank LIMIT ?",
+                params + [k],
+            ).fetchall()
+        # FTS5's bm25() is negative, more negative is more relevant
+        return [
+            (Document(id=str(row_id), page_content=text, metadata=json.loads(metadata)), -rank)
+            for row_id, text, metadata, rank in rows
+        ]
+
+
+def write_docstore(path: str, rows: Iterable[Tuple[int, str, str]]) -> None:
+    """Create chunks.sqlite at path from (position, text, metadata json) rows."""
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(
+            "CREATE TABLE chunks (id INTEGER PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        conn.executemany("INSERT INTO chunks VALUES (?, ?, ?)", rows)
+        conn.execute(
+            "CREATE VIRTUAL TABLE chunks_fts USING fts5("
+            "text, content='chunks', content_rowid='id', tokenize='porter unicode61')"
+        )
+        conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild')")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def save_compact_index(vector_store: FAISS, path: str) -> None:
+    """Write a FAISS vector store to path as index.faiss + chunks.sqlite."""
+    os.makedirs(path, exist_ok=True)
+    faiss.write_index(vector_store.index, os.path.join(path, INDEX_FILE))
+
+    rows = []
+    for position in range(vector_store.index.ntotal):
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[position])
+        rows.append((position, doc.page_content, json.dumps(doc.metadata)))
+    write_docstore(os.path.join(path, DOCSTORE_FILE), rows)
+
+
+def merge_compact_indexes(sources: List[Tuple[str, str]], path: str, mode: str) -> None:
+    """Write one compact store at path holding the chunks of several.
+
+    sources are (store path, doc_id) pairs; every chunk's metadata gets the
+    doc_id of the store it came from.
+    """
+    os.makedirs(path, exist_ok=True)
+    # read into memory, merging binary indexes moves their codes
+    indexes = [faiss.read_index(os.path.join(source, INDEX_FILE)) for source, _ in sources]
+    offsets = [0]
+    for index in indexes:
+        offsets.append(offsets[-1] + index.ntotal)
+    faiss.write_index(merge_indexes(indexes, mode), os.path.join(path, INDEX_FILE))
+
+    rows = []
+    for (source, doc_id), offset in zip(sources, offsets):
+        conn = sqlite3.connect(f"file:{os.path.join(source, DOCSTORE_FILE)}?mode=ro", uri=True)
+        try:
+            for position, text, metadata in conn.execute(
+                "SELECT id, text, metadata FROM chunks ORDER BY id"
+            ):
+                rows.append(
+                    (offset + position, text, json.dumps({**json.loads(metadata), "doc_id": doc_id}))
+                )
+        finally:
+            conn.close()
+    write_docstore(os.path.join(path, DOCSTORE_FILE), rows)
+
+
+def search_ids(index, vector: np.ndarray, k: int, ids: List[int]) -> List[Tuple[int, float]]:
+    """(position, distance) of the k nearest vectors among the given positions."""
+    selector = faiss.IDSelectorBatch(np.asarray(ids, dtype="int64"))
+    try:
+        distances, positions = index.search(
+            vector, min(k, len(ids)), params=faiss.SearchParameters(sel=selector)
+        )
+    except RuntimeError:
+        # IndexLSH takes no search parameters, it scans every code anyway so
+        # rank them all and keep the allowed ones
+        distances, positions = index.search(vector, index.ntotal)
+        allowed = set(ids)
+        pairs = [
+            (int(position), float(distance))
+            for position, distance in zip(positions[0], distances[0])
+            if position in allowed
+        ]
+        return pairs[:k]
+    return [
+        (int(position), float(distance))
+        for position, distance in zip(positions[0], distances[0])
+        if position >= 0
+    ]
+
+
+def is_compact_index(path: str) -> bool:
+    return os.path.exists(os.path.join(path, INDEX_FILE)) and os.path.exists(
+        os.path.join(path, DOCSTORE_FILE)
+    )
+
+
+def load_compact_index(path: str, embeddings: Any) -> FAISS:
+    """Open a store written by save_compact_index without reading it into memory.
+
+    Vectors stay in the page cache (shared between worker processes) and chunk
+    texts are only read for the ids a search returns.
+    """
+    index = faiss.read_index(os.path.join(path, INDEX_FILE), MMAP_FLAG)
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=SqliteDocstore(os.path.join(path, DOCSTORE_FILE)),
+        index_to_docstore_id=PositionIds(index.ntotal),
+    )
@@ -0,0 +1,131 @@
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# finished jobs kept for the status endpoint, oldest dropped first
+MAX_FINISHED_JOBS = 256
+
+
+class IngestionJob:
+    """Status and progress of one background ingestion of a document."""
+
+    def __init__(self, doc_id: str, file_path: str):
+        self.job_id = uuid.uuid4().hex
+        self.doc_id = doc_id
+        self.file_path = file_path
+        self.status = "queued"  # queued -> running -> done | failed
+        self.stage = ""
+        self.pages = 0
+        self.chunks = 0
+        self.embedded = 0
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # only set while in flight, so a finished job does not keep its engine alive
+        self.task: Optional[asyncio.Task] = None
+
+    def set_stage(self, stage: str) -> None:
+        self.stage = stage
+
+    def add(self, pages: int = 0, chunks: int = 0, embedded: int = 0) -> None:
+        self.pages += pages
+        self.chunks += chunks
+        self.embedded += embedded
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        return {
+            "job_id": self.job_id,
+            "doc_id": self.doc_id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": {"pages": self.pages, "chunks": self.chunks, "embedded": self.embedded},
+            "error": self.error,
+            "created_at": self.created_at,
+            "seconds": round(end - (self.started_at or end), 3),
+        }
+
+
+class IngestionJobs:
+    """Single-flight background ingestion, one in-flight job per document.
+
+    ``runner(file_path, job)`` does the work and reports progress on ``job``.
+    Submitting a document that is already being ingested returns the running
+    job, so an upload and any number of questions on it share one ingestion.
+    Jobs live in this process, each worker runs its own; the disk cache is
+    what they share once a job is done.
+    """
+
+    def __init__(self, runner: Callable[[str, IngestionJob], Awaitable[Any]]):
+        self.runner = runner
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self.in_flight: Dict[str, IngestionJob] = {}
+
+    def submit(self, file_path: str, doc_id: str) -> IngestionJob:
+        """The in-flight job for doc_id, or a new one started on the running loop"""
+        job = self.in_flight.get(doc_id)
+        if job is not None and job.task.get_loop() is asyncio.get_running_loop():
+            return job
+
+        job = IngestionJob(doc_id, file_path)
+        job.task = asyncio.create_task(self._run(job))
+        job.task.add_done_callback(lambda _: self._finish(job))
+        self.in_flight[doc_id] = job
+        self.jobs[job.job_id] = job
+        self._prune()
+        print(f"Ingestion job {job.job_id} started for {doc_id}")
+        return job
+
+    async def wait(self, file_path: str, doc_id: str) -> Any:
+        """Result of the document's ingestion, joining the in-flight job if any.
+
+        Shielded: a caller that goes away does not cancel the shared job.
+        """
+        return await asyncio.shield(self.submit(file_path, doc_id).task)
+
+    async def _run(self, job: IngestionJob) -> Any:
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            result = await self.runner(job.file_path, job)
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            print(f"Ingestion job {job.job_id} failed: {e}")
+            raise
+        if result is None:
+            job.status = "failed"
+            job.error = "Document processing failed"
+        else:
+            job.status = "done"
+        return result
+
+    def _finish(self, job: IngestionJob) -> None:
+        job.finished_at = time.time()
+        task, job.task = job.task, None
+        if task.cancelled():
+            job.status = "failed"
+            job.error = "cancelled"
+        else:
+            # _run recorded any error, retrieving it keeps asyncio from logging
+            # it as never retrieved when nobody waited on the job
+            task.exception()
+        if self.in_flight.get(job.doc_id) is job:
+            del self.in_flight[job.doc_id]
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.task is None]
+        for job_id in finished[: max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    def stats(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for job in self.jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {"in_flight": len(self.in_flight), "jobs": statuses}
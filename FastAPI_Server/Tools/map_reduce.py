@@ -0,0 +1,164 @@
+import re
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.messages import HumanMessage
+
+# questions about the document as a whole rather than a fact in it
+WHOLE_DOCUMENT_PATTERN = re.compile(
+    r"\b(summari[sz]e|summary|overview|outline|key (points|takeaways|highlights)"
+    r"|(list|enumerate|name) (all|every|each)|all (the )?\w+ (mentioned|listed|disclosed)"
+    r"|(entire|whole|full) (document|report|filing)|throughout the (document|report))",
+    re.IGNORECASE,
+)
+
+MAP_PROMPT = """You are reading one part ({location}) of a financial document to help answer a question about the whole document.
+
+Question: {question}
+
+Excerpts:
+{context}
+
+Write concise notes with every fact, figure, date and item in these excerpts that is relevant to the question, citing page numbers. If nothing is relevant, reply with exactly NONE."""
+
+COLLAPSE_PROMPT = """Merge these notes, taken from consecutive parts of a financial document, into one set of notes for the question below. Keep every relevant fact, figure and page citation, drop duplicates.
+
+Question: {question}
+
+Notes:
+{notes}"""
+
+REDUCE_PROMPT = """Below are notes taken from every part of the document(s), in document order.
+
+{question}
+
+Notes:
+{notes}
+
+Answer using these notes only. Cover the whole document, keep figures, dates and page references exact, and do not repeat the same point twice."""
+
+NO_RELEVANT_NOTES = "The document does not contain information relevant to this question."
+
+
+def wants_whole_document(query: str) -> bool:
+    """True for summaries and "list every ..." questions, which top-k retrieval cannot cover"""
+    return bool(WHOLE_DOCUMENT_PATTERN.search(query))
+
+
+def group_by_size(texts: List[str], max_chars: int) -> List[List[int]]:
+    """Consecutive groups of indexes into texts, each at most max_chars long
+    (a single longer text gets a group of its own)."""
+    groups: List[List[int]] = []
+    size = 0
+    for index, text in enumerate(texts):
+        if groups and size + len(text) <= max_chars:
+            groups[-1].append(index)
+            size += len(text)
+        else:
+            groups.append([index])
+            size = len(text)
+    return groups
+
+
+def chunk_label(doc: Document, sources: Optional[Dict[str, str]]) -> str:
+    doc_id = doc.metadata.get("doc_id")
+    page = f"page {doc.metadata.get('page', '?')}"
+    return f"{(sources or {}).get(doc_id, doc_id)}, {page}" if doc_id else page
+
+
+def describe_location(docs: List[Document], sources: Optional[Dict[str, str]]) -> str:
+    """Page range covered by a batch, per document for collection batches"""
+    ranges: Dict[str, List[int]] = {}
+    for doc in docs:
+        doc_id = doc.metadata.get("doc_id", "")
+        page = doc.metadata.get("page")
+        if isinstance(page, int):
+            ranges.setdefault(doc_id, []).append(page)
+    parts = []
+    for doc_id, pages in ranges.items():
+        span = f"page {pages[0]}" if min(pages) == max(pages) else f"pages {min(pages)}-{max(pages)}"
+        parts.append(f"{(sources or {}).get(doc_id, doc_id)} {span}" if doc_id else span)
+    return "; ".join(parts) or "part of the document"
+
+
+async def map_reduce_answer(
+    llm: Any,
+    question: str,
+    final_question: str,
+    docs: List[Document],
+    sources: Optional[Dict[str, str]] = None,
+    concurrency: int = 8,
+    batch_chars: int = 24000,
+    on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> str:
+    """Answer a question over every chunk of a document.
+
+    Map: chunks are packed in document order into batches of up to
+    batch_chars and each batch is turned into notes for `question`, at most
+    `concurrency` LLM calls at a time. `on_partial` gets each batch's notes as
+    it finishes. Reduce: notes are merged in document order (collapsed in
+    rounds while they exceed batch_chars) and `final_question` is answered
+    from them. A failed map call loses its batch, not the answer; a failed
+    collapse keeps its notes as they were and a failed reduce returns the
+    notes themselves.
+    """
+    labelled = [f"[{chunk_label(doc, sources)}]\n{doc.page_content}" for doc in docs]
+    groups = group_by_size(labelled, batch_chars)
+    batches = [[docs[index] for index in group] for group in groups]
+    contexts = ["\n\n".join(labelled[index] for index in group) for group in groups]
+    semaphore = asyncio.Semaphore(concurrency)
+    print(f"Map-reduce over {len(docs)} chunks in {len(batches)} batches, {concurrency} at a time")
+
+    async def complete(prompt: str) -> str:
+        async with semaphore:
+            return (await llm.ainvoke([HumanMessage(content=prompt)])).content.strip()
+
+    async def map_batch(index: int) -> tuple:
+        location = describe_location(batches[index], sources)
+        try:
+            notes = await complete(
+                MAP_PROMPT.format(location=location, question=question, context=contexts[index])
+            )
+        except Exception as e:
+            print(f"Map call for {location} failed: {e}")
+            notes = ""
+        relevant = bool(notes) and notes.strip(" .").upper() != "NONE"
+        return index, location, notes if relevant else ""
+
+    notes = [""] * len(batches)
+    async with asyncio.TaskGroup() as group:
+        tasks = [group.create_task(map_batch(index)) for index in range(len(batches))]
+        for done, next_done in enumerate(asyncio.as_completed(tasks), start=1):
+            index, location, text = await next_done
+            notes[index] = f"({location})\n{text}" if text else ""
+            if on_partial is not None:
+                on_partial({"done": done, "total": len(batches), "location": location, "notes": text})
+
+    notes = [text for text in notes if text]
+    if not notes:
+        return NO_RELEVANT_NOTES
+
+    async def collapse(indexes: List[int]) -> str:
+        if len(indexes) == 1:
+            return notes[indexes[0]]
+        merged = "\n\n".join(notes[index] for index in indexes)
+        try:
+            return await complete(COLLAPSE_PROMPT.format(question=question, notes=merged))
+        except Exception as e:
+            print(f"Collapse call for {len(indexes)} notes failed: {e}")
+            return merged
+
+    while sum(len(text) for text in notes) > batch_chars:
+        groups = group_by_size(notes, batch_chars)
+        if len(groups) == len(notes):
+            # every note is a batch of its own already, merging cannot shrink them
+            break
+        notes = list(await asyncio.gather(*(collapse(indexes) for indexes in groups)))
+
+    joined = "\n\n".join(notes)
+    try:
+        return await complete(REDUCE_PROMPT.format(question=final_question, notes=joined))
+    except Exception as e:
+        print(f"Reduce call failed: {e}, returning the notes")
+        return joined
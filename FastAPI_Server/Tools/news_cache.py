@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from Tools.disk_cache import touch
+
+load_dotenv()
+
+# searches for the same optimized query within one bucket share the results
+NEWS_SEARCH_TTL = float(os.getenv("NEWS_SEARCH_TTL_SECONDS", 1800))
+# extracted article text is served without asking the publisher for this long,
+# then revalidated with If-None-Match / If-Modified-Since
+NEWS_ARTICLE_TTL = float(os.getenv("NEWS_ARTICLE_TTL_SECONDS", 6 * 3600))
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            record = json.load(file)
+    except (OSError, ValueError):
+        return None
+    touch(path)
+    return record
+
+
+def write_json(path: str, record: Dict[str, Any]) -> None:
+    """Write to a temp file and rename, so readers never see half a record"""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(record, file)
+    os.replace(tmp_path, path)
+
+
+class NewsCache:
+    """Disk-backed cache of news searches and extracted article text.
+
+    search/<md5>.json    search response for (optimized query, search params, time bucket)
+    articles/<md5>.json  extracted text of a URL with the ETag / Last-Modified it came with
+
+    Files survive restarts and are shared by worker processes; old ones are
+    removed by the DiskCache sweeper in Main. Methods do blocking file I/O,
+    call them through asyncio.to_thread.
+    """
+
+    def __init__(
+        self, root: str, search_ttl: float = NEWS_SEARCH_TTL, article_ttl: float = NEWS_ARTICLE_TTL
+    ):
+        self.root = root
+        self.search_ttl = search_ttl
+        self.article_ttl = article_ttl
+        self.search_dir = os.path.join(root, "search")
+        self.article_dir = os.path.join(root, "articles")
+        for directory in (self.search_dir, self.article_dir):
+            os.makedirs(directory, exist_ok=True)
+        self.counts = {"search_hits": 0, "search_misses": 0, "article_hits": 0,
+                       "article_revalidated": 0, "article_misses": 0}
+
+    def search_path(self, query: str, params: Dict[str, Any]) -> str:
+        bucket = int(time.time() // self.search_ttl)
+        key = json.dumps([normalize_query(query), params, bucket], sort_keys=True)
+        return os.path.join(self.search_dir, f"{hashlib.md5(key.encode()).hexdigest()}.json")
+
+    def get_search(self, query: str, params: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        response = read_json(self.search_path(query, params))
+        self.counts["search_hits" if response is not None else "search_misses"] += 1
+        return response
+
+    def put_search(self, query: str, params: Dict[str, Any], response: Dict[str, Any]) -> None:
+        write_json(self.search_path(query, params), response)
+
+    def article_path(self, url: str) -> str:
+        return os.path.join(self.article_dir, f"{hashlib.md5(url.encode()).hexdigest()}.json")
+
+    def get_article(self, url: str) -> Optional[Dict[str, Any]]:
+        return read_json(self.article_path(url))
+
+    def is_fresh(self, record: Dict[str, Any]) -> bool:
+        return time.time() - record["checked_at"] < self.article_ttl
+
+    @staticmethod
+    def validators(record: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """Conditional request headers for revalidating a cached article"""
+        headers = {}
+        if record and record.get("etag"):
+            headers["If-None-Match"] = record["etag"]
+        if record and record.get("last_modified"):
+            headers["If-Modified-Since"] = record["last_modified"]
+        return headers
+
+    def put_article(self, url: str, text: str, headers: Any) -> None:
+        write_json(
+            self.article_path(url),
+            {
+                "url": url,
+                "text": text,
+                "etag": headers.get("etag"),
+                "last_modified": headers.get("last-modified"),
+                "checked_at": time.time(),
+            },
+        )
+
+    def revalidated(self, url: str, record: Dict[str, Any]) -> None:
+        """The publisher answered 304, the cached text is good for another TTL"""
+        write_json(self.article_path(url), {**record, "checked_at": time.time()})
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "search_ttl_seconds": self.search_ttl,
+            "article_ttl_seconds": self.article_ttl,
+            **self.counts,
+        }
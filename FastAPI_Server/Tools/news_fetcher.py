@@ -0,0 +1,141 @@
+import os
+import time
+import asyncio
+from typing import Any, Awaitable, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# connections kept open across requests, most results come from the same few publishers
+NEWS_MAX_CONNECTIONS = int(os.getenv("NEWS_MAX_CONNECTIONS", 20))
+# requests in flight to one publisher at a time
+NEWS_PER_DOMAIN = int(os.getenv("NEWS_PER_DOMAIN", 2))
+# connect / read timeout of a single request
+NEWS_FETCH_TIMEOUT = float(os.getenv("NEWS_FETCH_TIMEOUT", 6))
+# fetching and extracting all articles, the answer uses what arrived by then
+NEWS_FETCH_DEADLINE = float(os.getenv("NEWS_FETCH_DEADLINE", 8))
+
+# some publishers refuse httpx's default user agent
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; FinanceGPT/1.0)",
+    "Accept": "text/html,application/xhtml+xml",
+}
+
+
+def domain_of(url: str) -> str:
+    host = urlsplit(url).hostname or ""
+    return host[4:] if host.startswith("www.") else host
+
+
+class ArticleFetcher:
+    """Shared keep-alive HTTP client for news articles with per-domain limits.
+
+    The client and the per-domain semaphores belong to the event loop they
+    were created on and are recreated for a new one, retiring the old client;
+    Main's lifespan closes the client on shutdown.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = NEWS_MAX_CONNECTIONS,
+        per_domain: int = NEWS_PER_DOMAIN,
+        timeout: float = NEWS_FETCH_TIMEOUT,
+    ):
+        self.max_connections = max_connections
+        self.per_domain = per_domain
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._domains: Dict[str, asyncio.Semaphore] = {}
+        self.fetched = 0
+        self.failed = 0
+
+    def client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            if self._client is not None:
+                self.retire(self._client, self._loop)
+            self._client = httpx.AsyncClient(
+                headers=HEADERS,
+                follow_redirects=True,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60,
+                ),
+            )
+            self._loop = loop
+            self._domains = {}
+        return self._client
+
+    @staticmethod
+    def retire(client: httpx.AsyncClient, loop: Optional[asyncio.AbstractEventLoop]) -> None:
+        """Close a client made on another event loop. Its connections belong to
+        that loop, so it is closed there; once the loop is closed aclose() can
+        no longer run and the dropped client's sockets go with it on collection."""
+        if loop is not None and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+    async def fetch(
+        self, url: str, headers: Optional[Dict[str, str]] = None
+    ) -> Optional[httpx.Response]:
+        """Response for url, None when it cannot be fetched. With conditional
+        headers (If-None-Match, ...) an unchanged page comes back as a 304."""
+        client = self.client()
+        semaphore = self._domains.setdefault(domain_of(url), asyncio.Semaphore(self.per_domain))
+        started = time.perf_counter()
+        try:
+            async with semaphore:
+                response = await client.get(url, headers=headers)
+                if response.status_code != 304:
+                    response.raise_for_status()
+        except httpx.HTTPError as e:
+            self.failed += 1
+            print(f"Error fetching {url}: {e!r}")
+            return None
+        self.fetched += 1
+        print(f"Fetched {url} ({response.status_code}) in {time.perf_counter() - started:.2f}s")
+        return response
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"fetched": self.fetched, "failed": self.failed, "per_domain": self.per_domain}
+
+
+async def gather_until(awaitables: Iterable[Awaitable[Any]], timeout: float) -> List[Any]:
+    """Results in order, None for those that failed or were not done within
+    timeout; the unfinished ones are cancelled."""
+    tasks = [asyncio.ensure_future(awaitable) for awaitable in awaitables]
+    if not tasks:
+        return []
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+    if pending:
+        print(f"Deadline of {timeout}s passed with {len(pending)} of {len(tasks)} still pending")
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    results = []
+    for task in tasks:
+        if task not in done or task.cancelled():
+            results.append(None)
+        elif task.exception() is not None:
+            print(f"Fetch task failed: {task.exception()!r}")
+            results.append(None)
+        else:
+            results.append(task.result())
+    return results
+
+
+news_fetcher = ArticleFetcher()
@@ -0,0 +1,122 @@
+import os
+from typing import List, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# article text handed to the summarizing LLM, roughly 4 characters per token
+NEWS_CONTEXT_TOKENS = int(os.getenv("NEWS_CONTEXT_TOKENS", 3000))
+# paragraphs are merged / split into passages of about this many words
+NEWS_PASSAGE_WORDS = int(os.getenv("NEWS_PASSAGE_WORDS", 120))
+
+# marks passages left out before, between or after kept ones
+GAP = "[...]"
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4 + 1
+
+
+def split_passages(text: str, max_words: int = NEWS_PASSAGE_WORDS) -> List[str]:
+    """Consecutive paragraphs merged up to max_words, longer paragraphs cut in pieces"""
+    passages, current, count = [], [], 0
+    for paragraph in text.split("\n"):
+        words = paragraph.split()
+        if not words:
+            continue
+        if count and count + len(words) > max_words:
+            passages.append("\n".join(current))
+            current, count = [], 0
+        for start in range(0, len(words), max_words):
+            piece = words[start:start + max_words]
+            if len(piece) == max_words:
+                passages.append(" ".join(piece))
+            else:
+                current.append(" ".join(piece))
+                count += len(piece)
+    if current:
+        passages.append("\n".join(current))
+    return passages
+
+
+def trim_articles(
+    articles: List[Tuple[str, str]], token_budget: int = NEWS_CONTEXT_TOKENS
+) -> List[Tuple[str, str]]:
+    """Articles cut to an equal share of token_budget each, marked with [...]
+    where cut. The fallback when passages cannot be selected."""
+    if not articles:
+        return articles
+    share = max(token_budget // len(articles), 1) * 4
+    return [
+        (url, text if len(text) <= share else f"{text[:share]}\n{GAP}")
+        for url, text in articles
+    ]
+
+
+def select_passages(
+    embedder,
+    query: str,
+    articles: List[Tuple[str, str]],
+    token_budget: int = NEWS_CONTEXT_TOKENS,
+    max_words: int = NEWS_PASSAGE_WORDS,
+) -> List[Tuple[str, str]]:
+    """The passages of (url, text) articles most similar to query, within token_budget.
+
+    Every article keeps its best passage first, the remaining budget goes to
+    the best passages overall. Kept passages stay in article order, skipped
+    stretches are marked with [...]. Articles that already fit are returned
+    unchanged without embedding anything. Blocking, call through
+    asyncio.to_thread.
+    """
+    total = sum(estimate_tokens(text) for _, text in articles)
+    if total <= token_budget:
+        return articles
+
+    passages = [
+        (index, position, passage)
+        for index, (_, text) in enumerate(articles)
+        for position, passage in enumerate(split_passages(text, max_words))
+    ]
+    # query-time work, kept out of the ingestion stats of EmbeddingEngine.encode
+    vectors = embedder.encode_inline([query] + [passage for _, _, passage in passages])
+    vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    scores = vectors[1:] @ vectors[0]
+    ranked = np.argsort(-scores).tolist()
+
+    # best passage of every article first, so no source drops out entirely
+    best_of = {}
+    for rank in ranked:
+        best_of.setdefault(passages[rank][0], rank)
+    order = list(best_of.values()) + [rank for rank in ranked if rank not in best_of.values()]
+
+    chosen, used = set(), 0
+    for rank in order:
+        cost = estimate_tokens(passages[rank][2])
+        if used + cost > token_budget:
+            continue
+        chosen.add(rank)
+        used += cost
+
+    counts = [0] * len(articles)
+    for index, _, _ in passages:
+        counts[index] += 1
+    selected = []
+    for index, (url, _) in enumerate(articles):
+        kept, last = [], -1
+        for rank in sorted(r for r in chosen if passages[r][0] == index):
+            position = passages[rank][1]
+            if position != last + 1:
+                kept.append(GAP)
+            kept.append(passages[rank][2])
+            last = position
+        if kept and last != counts[index] - 1:
+            kept.append(GAP)
+        if kept:
+            selected.append((url, "\n".join(kept)))
+    print(
+        f"Selected {len(chosen)} of {len(passages)} passages "
+        f"(~{used} of ~{total} tokens) for: {query}"
+    )
+    return selected
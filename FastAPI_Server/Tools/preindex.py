@@ -0,0 +1,150 @@
+"""Warm faiss_cache for a directory of documents ahead of time.
+
+    python -m Tools.preindex <directory> [--workers N] [--ext .pdf ...]
+
+Run from FastAPI_Server, like the server, so the same ./faiss_cache is filled.
+Files are indexed exactly as setup_rag_system would on first upload, same
+hashing and cache keys, so the server finds them on the first question.
+
+Interrupting is safe: every cache layer is published with an atomic rename.
+A rerun skips documents whose index is already published and picks the rest
+up from their cached text and chunks, so remote extraction is never repeated.
+"""
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List
+
+
+def find_documents(directory: str, extensions: List[str]) -> List[str]:
+    extensions = tuple(extension.lower() for extension in extensions)
+    return sorted(
+        os.path.join(dirpath, filename)
+        for dirpath, _, filenames in os.walk(directory)
+        for filename in filenames
+        if filename.lower().endswith(extensions)
+    )
+
+
+def init_worker(threads: int) -> None:
+    # one process per document already uses the cores, nested embedding pools
+    # and full-width torch thread pools in every process would oversubscribe them
+    os.environ.setdefault("EMBED_WORKERS", "1")
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+
+
+def index_file(file_path: str) -> Dict[str, Any]:
+    """Index one document into the cache, returns what was done and how fast"""
+    # imported in the worker, each process loads its own embedding model
+    from Tools import Doc_QnA_RAG as rag
+    from Tools.index_store import is_compact_index
+
+    started = time.perf_counter()
+    result: Dict[str, Any] = {"path": file_path, "bytes": os.path.getsize(file_path)}
+    try:
+        file_hash = rag.cached_file_hash(file_path)
+        index_key = rag.index_cache_key(file_hash)
+        result["doc_id"] = file_hash
+        if is_compact_index(os.path.join(rag.INDEX_CACHE_DIR, index_key)):
+            result["status"] = "cached"
+        else:
+            query_engine = rag.setup_rag_system(file_path)
+            result["status"] = "indexed" if query_engine is not None else "failed"
+            # nothing will query it here, leave the memory to the next document
+            rag.vector_store_cache.invalidate(index_key)
+            chunks = rag.load_cached_chunks(file_hash) or []
+            pages = rag.load_cached_pages(file_hash)
+            result["chunks"] = len(chunks)
+            result["pages"] = len(pages) if pages is not None else len({c["page"] for c in chunks})
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+
+def describe(result: Dict[str, Any]) -> str:
+    name = os.path.basename(result["path"])
+    if result["status"] == "cached":
+        return f"cached   {name}"
+    if result["status"] == "failed":
+        return f"failed   {name}: {result.get('error', 'no text extracted')}"
+    seconds = max(result["seconds"], 1e-9)
+    return (
+        f"indexed  {name}: {result['pages']} pages, {result['chunks']} chunks in "
+        f"{result['seconds']:.1f}s ({result['pages'] / seconds:.2f} pages/s, "
+        f"{result['bytes'] / seconds / 1024 / 1024:.2f} MB/s)"
+    )
+
+
+def print_summary(results: List[Dict[str, Any]], total: int, wall_seconds: float) -> None:
+    indexed = [result for result in results if result["status"] == "indexed"]
+    counts = {
+        status: sum(1 for result in results if result["status"] == status)
+        for status in ("indexed", "cached", "failed")
+    }
+    pages = sum(result["pages"] for result in indexed)
+    chunks = sum(result["chunks"] for result in indexed)
+    megabytes = sum(result["bytes"] for result in indexed) / 1024 / 1024
+    wall_seconds = max(wall_seconds, 1e-9)
+
+    print(
+        f"\n{len(results)}/{total} files in {wall_seconds:.1f}s: {counts['indexed']} indexed, "
+        f"{counts['cached']} already cached, {counts['failed']} failed"
+    )
+    if indexed:
+        print(
+            f"{pages} pages, {chunks} chunks, {megabytes:.1f} MB indexed: "
+            f"{pages / wall_seconds:.2f} pages/s, {chunks / wall_seconds:.1f} chunks/s, "
+            f"{counts['indexed'] * 60 / wall_seconds:.1f} files/min"
+        )
+    for result in results:
+        if result["status"] == "failed":
+            print(f"  failed: {result['path']}")
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python -m Tools.preindex", description=__doc__.split("\n")[0])
+    parser.add_argument("directory")
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--ext", nargs="+", default=[".pdf"], help="file extensions to index")
+    args = parser.parse_args(argv)
+
+    files = find_documents(args.directory, args.ext)
+    if not files:
+        print(f"No {' / '.join(args.ext)} files under {args.directory}")
+        return 0
+    workers = max(1, min(args.workers, len(files)))
+    print(f"Indexing {len(files)} files with {workers} worker processes")
+
+    started = time.perf_counter()
+    results = []
+    # spawn, so every worker starts clean and imports the model after init_worker
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=init_worker,
+        initargs=(max(1, (os.cpu_count() or 1) // workers),),
+    )
+    try:
+        futures = [pool.submit(index_file, file_path) for file_path in files]
+        for future in as_completed(futures):
+            results.append(future.result())
+            print(f"[{len(results)}/{len(files)}] {describe(results[-1])}")
+    except KeyboardInterrupt:
+        print("\nInterrupted, rerun to resume from the cache")
+        pool.shutdown(wait=False, cancel_futures=True)
+        print_summary(results, len(files), time.perf_counter() - started)
+        return 130
+    pool.shutdown()
+
+    print_summary(results, len(files), time.perf_counter() - started)
+    return 1 if any(result["status"] == "failed" for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
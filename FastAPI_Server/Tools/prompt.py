@@ -206,10 +206,12 @@ Rules:
 7. Use external memory for user preferences and past topics
 8. When unsure → use General_qna
 9. for normal human conversations -> use General_qna
+10. For document questions that need the whole document (summaries, "list every ...", overviews) → add "mode": "map_reduce" to the Document_qna agent
 
 Examples:
 - "Hi there" → {"agents": [{"name": "General_qna", "query": "Hi there", "dependencies": []}], "reasoning": "Greeting"}
 - "What's in the document?" + History shows uploaded doc → {"agents": [{"name": "Document_qna", "query": "What's in the document?", "dependencies": []}], "reasoning": "Document question with context"}
+- "Summarize this annual report" + History shows uploaded doc → {"agents": [{"name": "Document_qna", "query": "Summarize the annual report", "mode": "map_reduce", "dependencies": []}], "reasoning": "Whole-document summary"}
 - "Make it shorter" + History shows previous response → {"agents": [{"name": "Refiner", "query": "Make the previous response shorter", "dependencies": []}], "reasoning": "Follow-up to modify previous output"}
 
 Context Information:
@@ -0,0 +1,163 @@
+import sys
+import random
+from typing import Any, Dict, List, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+QUANTIZATION_MODES = ("none", "int8", "binary")
+
+
+def build_quantized_index(vectors: np.ndarray, mode: str):
+    """FAISS index over vectors stored as float32 ("none"), int8 or 1 bit per dimension.
+
+    All three keep the float search API, so LangChain's FAISS wrapper can use them
+    unchanged. "binary" is an IndexLSH without rotation, i.e. the sign bit of
+    each dimension compared by Hamming distance.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    dim = vectors.shape[1]
+    if mode == "none":
+        index = faiss.IndexFlatL2(dim)
+    elif mode == "int8":
+        index = faiss.IndexScalarQuantizer(
+            dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2
+        )
+        index.train(vectors)
+    elif mode == "binary":
+        index = faiss.IndexLSH(dim, dim, False, False)
+    else:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    index.add(vectors)
+    return index
+
+
+def quantize_index(index, mode: str):
+    """Re-encode a flat float index in the given quantization mode."""
+    if mode == "none":
+        return index
+    return build_quantized_index(index.reconstruct_n(0, index.ntotal), mode)
+
+
+def merge_indexes(indexes: List[Any], mode: str):
+    """One index holding the vectors of all indexes, in order.
+
+    int8 codes are only meaningful with the ranges their index was trained on,
+    so float and int8 indexes are decoded and re-encoded together. Binary codes
+    are untrained sign bits and are concatenated as they are, which empties the
+    other indexes (they must own their codes, i.e. not be memory-mapped).
+    """
+    if mode == "binary":
+        merged = indexes[0]
+        for index in indexes[1:]:
+            merged.merge_from(index)
+        return merged
+    vectors = np.vstack([index.reconstruct_n(0, index.ntotal) for index in indexes])
+    return build_quantized_index(vectors, mode)
+
+
+def index_bytes(index) -> int:
+    return len(faiss.serialize_index(index))
+
+
+def rescore_order(query_vector: np.ndarray, candidate_vectors: np.ndarray) -> np.ndarray:
+    """Candidate positions sorted by exact L2 distance, the metric of the float index."""
+    distances = ((candidate_vectors - query_vector) ** 2).sum(axis=1)
+    return np.argsort(distances, kind="stable")
+
+
+def rescore_documents(engine: Any, query: str, docs: List[Document]) -> List[Tuple[Document, float]]:
+    """(doc, distance) pairs re-ranked with full-width, full-precision embeddings,
+    for candidates fetched from a truncated and/or quantized index.
+
+    The candidates are re-embedded rather than read from stored full vectors,
+    which would cost as much disk as the flat index the quantization replaces.
+    """
+    if not docs:
+        return []
+    # query-time work, kept out of the ingestion stats of EmbeddingEngine.encode
+    vectors = engine.encode_inline([query] + [doc.page_content for doc in docs], full=True)
+    distances = ((vectors[1:] - vectors[0]) ** 2).sum(axis=1)
+    order = np.argsort(distances, kind="stable")
+    return [(docs[position], float(distances[position])) for position in order]
+
+
+def recall_report(
+    engine: Any,
+    texts: Sequence[str],
+    queries: Sequence[str],
+    k: int = 10,
+    dims: Sequence[int | None] = (None, 512, 256, 128, 64),
+    modes: Sequence[str] = QUANTIZATION_MODES,
+    rescore_multiplier: int = 4,
+) -> List[Dict[str, Any]]:
+    """Recall@k of every (dimension, quantization) option against the full float index.
+
+    Ground truth is exact L2 search over full-width float32 vectors, which is
+    what the index stored before truncation and quantization were available.
+    ``size_ratio`` covers everything a rescored index keeps on disk, since the
+    rescoring vectors are re-embedded instead of stored.
+    """
+    full_texts = np.asarray(engine.encode(list(texts), full=True), dtype="float32")
+    full_queries = np.asarray(engine.encode(list(queries), full=True), dtype="float32")
+    k = min(k, len(texts))
+
+    baseline = build_quantized_index(full_texts, "none")
+    _, truth = baseline.search(full_queries, k)
+    baseline_bytes = index_bytes(baseline)
+
+    rows = []
+    for dim in dims:
+        if dim is not None and dim >= full_texts.shape[1]:
+            continue
+        width = dim or full_texts.shape[1]
+        for mode in modes:
+            index = build_quantized_index(full_texts[:, :width], mode)
+            fetch = min(k * rescore_multiplier, len(texts))
+            _, found = index.search(np.ascontiguousarray(full_queries[:, :width]), fetch)
+
+            plain_hits = rescored_hits = 0
+            for query_index, candidates in enumerate(found):
+                candidates = candidates[candidates >= 0]
+                expected = set(truth[query_index])
+                plain_hits += len(expected & set(candidates[:k]))
+                order = rescore_order(full_queries[query_index], full_texts[candidates])
+                rescored_hits += len(expected & set(candidates[order[:k]]))
+
+            size = index_bytes(index)
+            rows.append(
+                {
+                    "dim": width,
+                    "quantization": mode,
+                    "index_bytes": size,
+                    "size_ratio": round(size / baseline_bytes, 4),
+                    f"recall@{k}": round(plain_hits / (k * len(queries)), 4),
+                    f"recall@{k}_rescored": round(rescored_hits / (k * len(queries)), 4),
+                }
+            )
+    return rows
+
+
+def print_report(rows: List[Dict[str, Any]]) -> None:
+    if not rows:
+        print("Nothing to report")
+        return
+    columns = list(rows[0].keys())
+    print("  ".join(f"{column:>18}" for column in columns))
+    for row in rows:
+        print("  ".join(f"{str(row[column]):>18}" for column in columns))
+
+
+if __name__ == "__main__":
+    # python -m Tools.quantization <document.pdf> [num_queries]
+    from Tools.Doc_QnA_RAG import cached_file_hash, embeddings_model, get_chunks
+
+    file_path = sys.argv[1]
+    num_queries = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+
+    chunks = [chunk["text"] for chunk in get_chunks(file_path, cached_file_hash(file_path))]
+    sample = random.Random(0).sample(chunks, min(num_queries, len(chunks)))
+    # the opening of a chunk is a query whose answer is known to be in the document
+    queries = [text[:200] for text in sample]
+    print_report(recall_report(embeddings_model, chunks, queries))
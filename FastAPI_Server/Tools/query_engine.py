@@ -0,0 +1,67 @@
+from typing import Any, Dict, List, Optional
+
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.runnables import Runnable
+
+
+def format_context(docs: List[Document], sources: Optional[Dict[str, str]] = None) -> str:
+    """Chunks joined for the prompt, each labelled with its document when it
+    comes from a collection, so answers can tell the documents apart."""
+    parts = []
+    for doc in docs:
+        doc_id = doc.metadata.get("doc_id")
+        if doc_id:
+            parts.append(f"[Source: {(sources or {}).get(doc_id, doc_id)}]\n{doc.page_content}")
+        else:
+            parts.append(doc.page_content)
+    return "\n\n".join(parts)
+
+
+class DocumentQueryEngine:
+    """Retriever and answer chain of one document (or collection) index.
+
+    Built once when the index is loaded and cached with it, so a query only
+    does the embedding, search and generation work.
+    """
+
+    def __init__(self, vector_store: Any, retriever: BaseRetriever, chain: Runnable):
+        self.vector_store = vector_store
+        self.retriever = retriever
+        self.chain = chain
+
+    def all_documents(self) -> List[Document]:
+        """Every chunk of the index in document and page order"""
+        store = self.vector_store
+        ids = [store.index_to_docstore_id[position] for position in range(store.index.ntotal)]
+        fetch = getattr(store.docstore, "fetch", None)
+        if fetch is not None:
+            docs = fetch(ids)
+        else:
+            docs = [store.docstore.search(doc_id) for doc_id in ids]
+        # OCR'd pages of a scanned PDF are indexed after the text-layer ones, so
+        # index order is not page order; documents of a collection keep their order
+        documents: Dict[str, int] = {}
+        for doc in docs:
+            documents.setdefault(doc.metadata.get("doc_id", ""), len(documents))
+        return sorted(
+            docs,
+            key=lambda doc: (documents[doc.metadata.get("doc_id", "")], doc.metadata.get("page") or 0),
+        )
+
+    async def aretrieve(self, search_query: str) -> List[Document]:
+        return await self.retriever.ainvoke(search_query)
+
+    async def aquery(
+        self, search_query: str, question: str, sources: Optional[Dict[str, str]] = None
+    ) -> str:
+        """Answer question from the chunks retrieved for search_query.
+
+        sources maps doc_id -> display name for labelling collection chunks.
+        """
+        docs = await self.aretrieve(search_query)
+        # "stuff" the selected chunks into the prompt
+        result = await self.chain.ainvoke(
+            {"context": format_context(docs, sources), "question": question}
+        )
+        return result.content
@@ -10,7 +10,7 @@ load_dotenv(override=True)
 
 
 @tool
-def ContentRefiner(
+async def ContentRefiner(
     query: str,
     dependency_context: str = "",
     message_history: List[Union[AIMessage, HumanMessage]] = [],
@@ -75,7 +75,7 @@ def ContentRefiner(
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": structured_prompt},
         ]
-        response = llm.invoke(messages)
+        response = await llm.ainvoke(messages)
         result = response.content
     except Exception as e:
         print(f"Error in ContentRefiner: {e}")
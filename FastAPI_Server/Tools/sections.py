@@ -0,0 +1,101 @@
+import re
+from typing import List, Tuple
+
+# bump when the patterns change, it is part of the chunk cache key
+SECTIONS_VERSION = 1
+
+# canonical section name -> pattern, matched case-insensitively against short
+# heading lines in documents and anywhere in queries
+SECTION_PATTERNS = {
+    "Balance Sheet": r"balance sheets?|statements? of financial (position|condition)",
+    "Income Statement": r"income statements?|statements? of (consolidated )?(operations|income|earnings)"
+    r"|profit (and|&) loss|statements? of profit",
+    "Comprehensive Income": r"statements? of comprehensive income",
+    "Cash Flow Statement": r"cash ?flows? statements?|statements? of cash ?flows?",
+    "Changes in Equity": r"statements? of changes in (\w+'?s?'? )?equity|statements? of (shareholders|stockholders)'? equity",
+    "Notes to Accounts": r"notes to (the )?(consolidated |standalone )?(financial statements|accounts)",
+    "Management Discussion": r"management'?s discussion and analysis|\bmd&a\b",
+    "Auditor's Report": r"auditors?'?s?'? report|report of independent registered public accounting firm",
+    "Directors' Report": r"directors'? report|board'?s report",
+    "Risk Factors": r"risk factors",
+    "Segment Information": r"segment (information|reporting)",
+    "Corporate Governance": r"corporate governance",
+}
+COMPILED_SECTIONS = {
+    name: re.compile(pattern, re.IGNORECASE) for name, pattern in SECTION_PATTERNS.items()
+}
+
+# headings are short lines, longer ones mentioning a section are body text
+MAX_HEADING_CHARS = 80
+MAX_HEADING_WORDS = 10
+
+# no bare "p." form, it would read "S&P. 500" as page 500
+PAGE_REFERENCE = re.compile(
+    r"\b(?:pages?|pg\.?)\s*(\d{1,4})(?:\s*(?:-|–|to|and)\s*(\d{1,4}))?", re.IGNORECASE
+)
+MAX_PAGE_RANGE = 50
+
+
+def detect_heading(line: str) -> str:
+    """Canonical section name if line looks like a section heading, else ''"""
+    line = line.strip()
+    if not line or len(line) > MAX_HEADING_CHARS or len(line.split()) > MAX_HEADING_WORDS:
+        return ""
+    for name, pattern in COMPILED_SECTIONS.items():
+        if pattern.search(line):
+            return name
+    return ""
+
+
+def section_boundaries(text: str, carried: str = "") -> List[Tuple[int, str]]:
+    """(offset, section) for every heading in text, starting with the section
+    carried over from the previous page at offset 0"""
+    boundaries = [(0, carried)]
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        section = detect_heading(line)
+        if section and section != boundaries[-1][1]:
+            boundaries.append((offset, section))
+        offset += len(line)
+    return boundaries
+
+
+def section_for_span(boundaries: List[Tuple[int, str]], start: int, end: int) -> str:
+    """Section of a chunk: the one active at its start, or one whose heading
+    opens in the chunk's first half"""
+    section = ""
+    for offset, name in boundaries:
+        if offset > (start + end) // 2:
+            break
+        section = name
+    return section
+
+
+class SectionTracker:
+    """Carries the current section over to the next page while pages arrive in order"""
+
+    def __init__(self):
+        self.page = None
+        self.section = ""
+
+    def begin_page(self, page_number: int) -> str:
+        carried = self.section if self.page is not None and page_number == self.page + 1 else ""
+        self.page = page_number
+        return carried
+
+    def end_page(self, section: str) -> None:
+        self.section = section
+
+
+def query_filters(query: str) -> Tuple[List[int], List[str]]:
+    """(pages, sections) named in a query, e.g. "notes to accounts on page 12" """
+    pages = []
+    for match in PAGE_REFERENCE.finditer(query):
+        first = int(match.group(1))
+        last = int(match.group(2) or first)
+        if first <= last <= first + MAX_PAGE_RANGE:
+            pages.extend(range(first, last + 1))
+        else:
+            pages.append(first)
+    sections = [name for name, pattern in COMPILED_SECTIONS.items() if pattern.search(query)]
+    return sorted(set(pages)), sections
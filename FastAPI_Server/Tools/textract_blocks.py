@@ -0,0 +1,103 @@
+from typing import Any, Dict, List, Set
+
+# bump when the structure changes, it is part of the Textract cache file name
+STRUCTURE_VERSION = 1
+
+
+def child_ids(block: Dict[str, Any], relationship: str = "CHILD") -> List[str]:
+    return [
+        block_id
+        for related in block.get("Relationships", [])
+        if related["Type"] == relationship
+        for block_id in related["Ids"]
+    ]
+
+
+def block_text(block: Dict[str, Any], blocks: Dict[str, Dict[str, Any]]) -> str:
+    """Text of a cell, key or value from its WORD and SELECTION_ELEMENT children"""
+    words = []
+    for block_id in child_ids(block):
+        child = blocks.get(block_id, {})
+        if child.get("BlockType") == "WORD":
+            words.append(child["Text"])
+        elif child.get("BlockType") == "SELECTION_ELEMENT":
+            words.append("[X]" if child.get("SelectionStatus") == "SELECTED" else "[ ]")
+    return " ".join(words)
+
+
+def covered_words(block: Dict[str, Any], blocks: Dict[str, Dict[str, Any]]) -> Set[str]:
+    return {
+        block_id
+        for block_id in child_ids(block)
+        if blocks.get(block_id, {}).get("BlockType") == "WORD"
+    }
+
+
+def parse_blocks(response_blocks: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Key-value pairs, table grids and the remaining lines of a Textract
+    analyze_document (FORMS, TABLES) response.
+
+    Lines whose words all belong to a table or a form field are left out of
+    "lines", they are already in the structured parts.
+    """
+    blocks = {block["Id"]: block for block in response_blocks}
+    structured_words: Set[str] = set()
+
+    forms = []
+    for block in response_blocks:
+        if block["BlockType"] != "KEY_VALUE_SET" or "KEY" not in block.get("EntityTypes", []):
+            continue
+        values = [blocks[block_id] for block_id in child_ids(block, "VALUE") if block_id in blocks]
+        forms.append(
+            {
+                "key": block_text(block, blocks).rstrip(":").strip(),
+                "value": " ".join(block_text(value, blocks) for value in values).strip(),
+            }
+        )
+        structured_words |= covered_words(block, blocks)
+        for value in values:
+            structured_words |= covered_words(value, blocks)
+
+    tables = []
+    for block in response_blocks:
+        if block["BlockType"] != "TABLE":
+            continue
+        cells = [
+            blocks[block_id]
+            for block_id in child_ids(block)
+            if blocks.get(block_id, {}).get("BlockType") == "CELL"
+        ]
+        if not cells:
+            continue
+        rows = max(cell["RowIndex"] + cell.get("RowSpan", 1) - 1 for cell in cells)
+        columns = max(cell["ColumnIndex"] + cell.get("ColumnSpan", 1) - 1 for cell in cells)
+        grid = [[""] * columns for _ in range(rows)]
+        for cell in cells:
+            grid[cell["RowIndex"] - 1][cell["ColumnIndex"] - 1] = block_text(cell, blocks)
+            structured_words |= covered_words(cell, blocks)
+        tables.append(grid)
+
+    lines = []
+    for block in response_blocks:
+        if block["BlockType"] != "LINE":
+            continue
+        words = covered_words(block, blocks)
+        if not (words and words <= structured_words):
+            lines.append(block["Text"])
+    return {"version": STRUCTURE_VERSION, "forms": forms, "tables": tables, "lines": lines}
+
+
+def format_structure(structure: Dict[str, Any]) -> str:
+    """Compact text for the prompt: fields as "key: value", tables as pipe-separated rows"""
+    parts = []
+    if structure["forms"]:
+        parts.append(
+            "Key-value pairs:\n"
+            + "\n".join(f"{field['key']}: {field['value']}" for field in structure["forms"])
+        )
+    for number, grid in enumerate(structure["tables"], start=1):
+        rows = "\n".join(" | ".join(cell for cell in row) for row in grid)
+        parts.append(f"Table {number} ({len(grid)} rows x {len(grid[0])} columns):\n{rows}")
+    if structure["lines"]:
+        parts.append("Text:\n" + "\n".join(structure["lines"]))
+    return "\n\n".join(parts)
@@ -0,0 +1,131 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def estimate_store_bytes(store: Any) -> int:
+    """Rough in-memory size of a loaded FAISS vector store (vectors + chunk texts)."""
+    # query engines are cached with the store they wrap
+    store = getattr(store, "vector_store", store)
+    size = 0
+    index = getattr(store, "index", None)
+    if index is not None:
+        size += int(index.ntotal) * int(index.d) * 4
+
+    docstore = getattr(store, "docstore", None)
+    for doc in getattr(docstore, "_dict", {}).values():
+        size += len(getattr(doc, "page_content", "")) + 64
+    return size
+
+
+class VectorStoreCache:
+    """Thread safe LRU of loaded vector stores keyed by file hash.
+
+    Bounded both by number of entries and by an estimated memory budget.
+    Loads of the same key are single-flight: concurrent requests for a document
+    that is not cached yet wait for one load instead of each loading it.
+    """
+
+    def __init__(self, max_entries: int = 16, max_bytes: int = 1024 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, tuple[Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: str, store: Any, size_bytes: Optional[int] = None) -> None:
+        if size_bytes is None:
+            size_bytes = estimate_store_bytes(store)
+
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if size_bytes > self.max_bytes:
+                # Larger than the whole budget, serve it but do not keep it
+                print(f"Vector store {key} ({size_bytes} bytes) exceeds cache budget, not cached")
+                return
+            self._entries[key] = (store, size_bytes)
+            self.current_bytes += size_bytes
+            self._evict_locked()
+
+    def get_or_load(self, key: str, loader: Callable[[], Optional[Any]]) -> Optional[Any]:
+        """Return the cached store for key, calling loader() at most once concurrently."""
+        store = self.get(key)
+        if store is not None:
+            return store
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another thread may have finished loading while we waited
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    return entry[0]
+            try:
+                store = loader()
+                if store is not None:
+                    self.put(key, store)
+                return store
+            finally:
+                with self._lock:
+                    self._key_locks.pop(key, None)
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.current_bytes -= entry[1]
+
+    def _evict_locked(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_entries or self.current_bytes > self.max_bytes
+        ):
+            key, (_, size_bytes) = self._entries.popitem(last=False)
+            self.current_bytes -= size_bytes
+            self.evictions += 1
+            self.evicted_bytes += size_bytes
+            print(f"Evicted vector store {key} from memory ({size_bytes} bytes)")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+            }
+
+
+vector_store_cache = VectorStoreCache(
+    max_entries=int(os.getenv("VECTOR_CACHE_MAX_ENTRIES", 16)),
+    max_bytes=int(os.getenv("VECTOR_CACHE_MAX_MB", 1024)) * 1024 * 1024,
+)
@@ -0,0 +1,13 @@
+import os
+
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Entry point for `python serve.py`. Worker processes started with "spawn" (article
+# extraction, the embedding pool, the reloader) re-import the main module, so it is
+# kept to this launcher instead of Main.py with its graph and models.
+if __name__ == "__main__":
+    port = int(os.getenv("PORT", 8000))
+    uvicorn.run("Main:app", host="0.0.0.0", port=port, reload=True)
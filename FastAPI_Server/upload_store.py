@@ -0,0 +1,99 @@
+import os
+import re
+import json
+import uuid
+import asyncio
+import hashlib
+from typing import Any, Dict, Optional
+
+from fastapi import UploadFile
+
+from Tools.disk_cache import touch
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+DOC_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadStore:
+    """Content addressed store for uploaded files.
+
+    Uploads are streamed to disk in chunks while being MD5 hashed, then moved to
+    ``<root>/<md5><ext>`` next to a ``<md5>.meta.json`` sidecar. The MD5 doubles
+    as the ``doc_id`` clients use to reference the file later, and matches the
+    faiss_cache key of the document, so identical uploads share one file and one
+    index whatever extension they arrive with.
+    """
+
+    def __init__(self, root: str = "uploads"):
+        self.root = root
+        os.makedirs(self.root, exist_ok=True)
+
+    def _meta_path(self, doc_id: str) -> str:
+        return os.path.join(self.root, f"{doc_id}.meta.json")
+
+    async def save(self, file: UploadFile) -> Dict[str, Any]:
+        hasher = hashlib.md5()
+        size = 0
+        tmp_path = os.path.join(self.root, f".{uuid.uuid4()}.part")
+
+        try:
+            with open(tmp_path, "wb") as buffer:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    hasher.update(chunk)
+                    size += len(chunk)
+                    await asyncio.to_thread(buffer.write, chunk)
+
+            doc_id = hasher.hexdigest()
+            stored = self.get(doc_id)
+            if stored is not None:
+                # same bytes, possibly under another name or extension
+                local_path = stored["path"]
+            else:
+                extension = os.path.splitext(file.filename or "")[1].lower()
+                local_path = os.path.join(self.root, f"{doc_id}{extension}")
+
+            deduplicated = os.path.exists(local_path)
+            if deduplicated:
+                os.remove(tmp_path)
+                touch(local_path)
+            else:
+                os.replace(tmp_path, local_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+        meta = {
+            "doc_id": doc_id,
+            "filename": file.filename,
+            "content_type": file.content_type or "",
+            "size": size,
+            "path": local_path,
+        }
+        # the sidecar may be missing if an eviction was interrupted half way
+        if not deduplicated or not os.path.exists(self._meta_path(doc_id)):
+            with open(self._meta_path(doc_id), "w") as f:
+                json.dump(meta, f)
+        else:
+            touch(self._meta_path(doc_id))
+
+        return {**meta, "deduplicated": deduplicated}
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        """Metadata of a stored upload, None if the id is unknown or its file is gone."""
+        if not DOC_ID_PATTERN.match(doc_id or ""):
+            return None
+        try:
+            with open(self._meta_path(doc_id)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(meta.get("path", "")):
+            return None
+        touch(self._meta_path(doc_id))
+        touch(meta["path"])
+        return meta
+
+
+def is_image(meta: Dict[str, Any]) -> bool:
+    return "image" in (meta.get("content_type") or "")